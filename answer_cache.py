@@ -0,0 +1,128 @@
+# answer_cache.py
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from config import ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_DISTANCE
+from memory_logger import memory_collection_name
+from registry import resolve_collection_name
+
+# ----------------- Semantic Answer Cache -----------------
+class SemanticAnswerCache:
+    """
+    In-process cache of LLM answers keyed by question embedding.
+    A new question hits when its cosine distance to a cached question is within
+    max_distance and it was asked against the same set of collections by a user with
+    the same memory partition.
+    Each entry also records which physical collection every contributing collection
+    (documents, memory or the tutorial fallback) resolved to. Rebuilds swap a new physical
+    collection in through the alias file, in whichever process runs them, so an entry whose
+    sources no longer resolve the same way is dropped on its next lookup.
+    Entries expire after ttl seconds; the least recently used entry is evicted when full.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl: float = ANSWER_CACHE_TTL,
+                 max_distance: float = ANSWER_CACHE_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def collections_key(collection_names) -> frozenset:
+        return frozenset(collection_names or [])
+
+    def _expired(self, entry, now: float) -> bool:
+        return now - entry["created_at"] > self.ttl
+
+    @staticmethod
+    def _stale(entry, resolved: dict) -> bool:
+        for name, physical_name in entry["sources"].items():
+            if name not in resolved:
+                resolved[name] = resolve_collection_name(name)
+            if resolved[name] != physical_name:
+                return True
+        return False
+
+    def lookup(self, embedding, collection_names=None, user_email=None):
+        """Return the cached answer for the closest matching question, or None."""
+        query = self._normalize(embedding)
+        key = self.collections_key(collection_names)
+        # Answers may draw on the asker's private memory, so they are never shared across partitions
+        memory = memory_collection_name(user_email)
+        now = time.time()
+
+        resolved = {}
+        with self._lock:
+            best_id, best_distance = None, self.max_distance
+            for entry_id, entry in list(self._entries.items()):
+                if self._expired(entry, now):
+                    del self._entries[entry_id]
+                    self.evictions += 1
+                    continue
+                if entry["collections"] != key or entry["memory"] != memory:
+                    continue
+                if self._stale(entry, resolved):
+                    del self._entries[entry_id]
+                    self.invalidations += 1
+                    continue
+                distance = 1.0 - float(np.dot(query, entry["embedding"]))
+                if distance <= best_distance:
+                    best_id, best_distance = entry_id, distance
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id]["answer"]
+
+    def store(self, question: str, embedding, answer: str, collection_names=None, user_email=None, sources=()):
+        """sources: logical names of the collections whose hits the answer was generated from."""
+        sources = {name: resolve_collection_name(name) for name in sources}
+        with self._lock:
+            self._entries[self._next_id] = {
+                "question": question,
+                "embedding": self._normalize(embedding),
+                "answer": answer,
+                "collections": self.collections_key(collection_names),
+                "memory": memory_collection_name(user_email),
+                "sources": sources,
+                "created_at": time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+# Shared by every session in this process
+answer_cache = SemanticAnswerCache()
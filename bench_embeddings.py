@@ -0,0 +1,77 @@
+# bench_embeddings.py
+import re
+import sys
+import time
+import statistics
+import numpy as np
+from embedding_backends import BACKENDS, load_embedder
+
+# ----------------- Config -----------------
+TUTORIAL_PATH = "tutorials/python_tutorial.md"
+QUERIES = [
+    "how do I read a file",
+    "list comprehension syntax",
+    "what is the difference between a tuple and a list",
+    "how to handle a KeyError in a dictionary",
+    "define a class with an __init__ method",
+]
+LATENCY_RUNS = 50
+BATCH_SIZE = 32
+
+def load_passages(path: str = TUTORIAL_PATH, repeat: int = 8):
+    with open(path, "r", encoding="utf-8") as f:
+        sections = re.split(r'\n(?=#+ )', f.read().strip())
+    return sections * repeat
+
+def benchmark(backend: str, passages):
+    start = time.perf_counter()
+    embedder = load_embedder(backend)
+    load_seconds = time.perf_counter() - start
+
+    embedder.encode(QUERIES[0])  # warm-up
+    latencies = []
+    for i in range(LATENCY_RUNS):
+        start = time.perf_counter()
+        embedder.encode(QUERIES[i % len(QUERIES)])
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    embeddings = np.asarray(embedder.encode(passages, batch_size=BATCH_SIZE), dtype=np.float32)
+    batch_seconds = time.perf_counter() - start
+    return {
+        "load_s": load_seconds,
+        "query_p50_ms": statistics.median(latencies) * 1000,
+        "query_p95_ms": sorted(latencies)[int(len(latencies) * 0.95) - 1] * 1000,
+        "passages_per_s": len(passages) / batch_seconds,
+        "embeddings": embeddings,
+    }
+
+def cosine_agreement(reference, candidate):
+    """Row-wise cosine similarity between two sets of embeddings of the same texts."""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return np.sum(reference * candidate, axis=1)
+
+# ----------------- CLI -----------------
+if __name__ == "__main__":
+    backends = sys.argv[1:] or list(BACKENDS)
+    passages = load_passages()
+    print(f"Benchmarking {', '.join(backends)} on {len(passages)} passages (batch size {BATCH_SIZE})\n")
+
+    results = {}
+    for backend in backends:
+        try:
+            results[backend] = benchmark(backend, passages)
+        except Exception as e:
+            print(f"[{backend}] skipped: {e}")
+
+    reference = results.get("torch", {}).get("embeddings")
+    print(f"{'backend':<10} {'load s':>8} {'p50 ms':>8} {'p95 ms':>8} {'passages/s':>11} {'cos mean':>9} {'cos min':>8}")
+    for backend, result in results.items():
+        if reference is not None:
+            agreement = cosine_agreement(reference, result["embeddings"])
+            cos_mean, cos_min = f"{agreement.mean():.5f}", f"{agreement.min():.5f}"
+        else:
+            cos_mean = cos_min = "n/a"
+        print(f"{backend:<10} {result['load_s']:>8.2f} {result['query_p50_ms']:>8.2f} {result['query_p95_ms']:>8.2f} "
+              f"{result['passages_per_s']:>11.1f} {cos_mean:>9} {cos_min:>8}")
@@ -1,158 +1,187 @@
-import os
-import uuid
-import chromadb
-from sentence_transformers import SentenceTransformer
-import psycopg2
+import asyncio
+import threading
 import requests
-import json
+import httpx
 import hashlib
-
-# ----------------- Constants -----------------
-DEFAULT_TUTORIAL_COLLECTION = "python_tutorial"
-MEMORY_COLLECTION = "user_memory"
-VECTORSTORE_PATH = "./vectorstore"
-EMBED_MODEL = "./models/all-MiniLM-L6-v2" # Use local path
-LLM_ENDPOINT = "http://localhost:11434/api/generate"
-LLM_MODEL = "deepseek-coder:6.7b"
-
-# PostgreSQL config
-PG_HOST = "localhost"
-PG_DB = "devbot_db"
-PG_USER = "devbot_user"
-PG_PASS = "123456"
-
-# ----------------- Centralized Setup -----------------
-try:
-    # Initialize SentenceTransformer directly and pass embeddings manually
-    embed = SentenceTransformer(EMBED_MODEL)
-    client = chromadb.PersistentClient(path=VECTORSTORE_PATH)
-
-    # Load collections
-    tutorial = client.get_or_create_collection(name=DEFAULT_TUTORIAL_COLLECTION)
-    memory = client.get_or_create_collection(name=MEMORY_COLLECTION)
-
-except Exception as e:
-    print(f"Failed to initialize ChromaDB or embedding model: {e}")
-    exit(1)
+import time
+import retrieval
+from config import (
+    DEFAULT_TUTORIAL_COLLECTION, LLM_ENDPOINT, LLM_MODEL, HYBRID_RETRIEVAL, LLM_PREFETCH, CHAT_DEADLINE,
+)
+from db import get_connection
+from migrations import run_migrations
+from memory_logger import log_qa_pairs, memory_collection_name
+import write_behind
+from registry import get_collection, resolve_collection_name
+from embedding_cache import get_embedding_cache
+from answer_cache import answer_cache
+from llm_client import get_llm_client, get_async_llm_client, LLMError, LLMResponseError
+from llm_scheduler import get_scheduler, LLMBusyError
+from context_builder import build_context
+from collection_artifact import load_all_artifacts
 
 # ----------------- Helpers -----------------
 def make_hash(text: str) -> str:
     return hashlib.sha256(text.encode()).hexdigest()
 
-def retrieve_context(query, top_k=5, collection_names=None):
+def embed_query(query: str) -> list:
+    """Embed a query once so it can be reused across every collection lookup (cached by text)."""
+    return get_embedding_cache().encode_one(query).tolist()
+
+def _split_memory_hits(result_lists, memory_name: str):
+    # Hits carry the physical collection name, so memory_name must be resolved (see registry aliases)
+    memory_hits = [hits for hits in result_lists if hits and hits[0]["collection"] == memory_name]
+    doc_hits = [hits for hits in result_lists if hits and hits[0]["collection"] != memory_name]
+    return doc_hits, memory_hits
+
+def _combine_hits(doc_hits, lexical_hits, memory_hits, top_k: int, user_email=None):
+    """Fused document top_k followed by the memory top_k; used memories are touched."""
+    memory_context = retrieval.merge_top_k(memory_hits, top_k)
+    # Used memories are kept warm for LRU eviction
+    if memory_context:
+        write_behind.enqueue_memory_touch(user_email, [hit["id"] for hit in memory_context])
+    return retrieval.fuse_top_k(doc_hits, lexical_hits, top_k) + memory_context
+
+def retrieve_hits(query, top_k=5, collection_names=None, timings=None, query_embedding=None, user_email=None):
     """
-    Retrieve relevant chunks from uploaded document collections (if any) and memory.
+    Retrieve scored hits from uploaded document collections (if any) and memory.
     - collection_names: list of active collection names in order of upload.
-    - Prioritize document context first, then memory, then tutorial.
+    - Document collections are queried concurrently (vector search plus BM25 when
+      HYBRID_RETRIEVAL is on) and fused into one global top_k, so prompt size stays
+      bounded no matter how many documents are active.
+    - Memory adds at most top_k more hits from the user's own partition (user_email);
+      the tutorial is the fallback when both are empty.
+    - timings: optional dict that receives per-stage durations in seconds.
+    - query_embedding: reuse an embedding the caller already computed.
     """
-    context_chunks = []
+    stage_timings = timings if timings is not None else {}
 
     try:
-        # Query all uploaded document collections in reverse order (most recent first)
-        if collection_names:
-            for col_name in reversed(collection_names):
-                collection = client.get_or_create_collection(name=col_name)
-                results = collection.query(query_texts=[query], n_results=top_k)
-                doc_chunks = results.get("documents", [[]])[0]
-                context_chunks.extend(doc_chunks)
-
-        # Always add memory chunks as fallback
-        memory_results = memory.query(query_texts=[query], n_results=top_k)
-        memory_chunks = memory_results.get("documents", [[]])[0]
-        context_chunks.extend(memory_chunks)
+        # Embed the question once and fan the vector out to every collection
+        if query_embedding is None:
+            start = time.perf_counter()
+            query_embedding = embed_query(query)
+            stage_timings["embed"] = time.perf_counter() - start
+
+        # Query documents and memory in one concurrent round
+        start = time.perf_counter()
+        doc_collections = [get_collection(name) for name in collection_names or []]
+        memory = get_collection(memory_collection_name(user_email))
+        result_lists = retrieval.query_collections(doc_collections + [memory], query_embedding, top_k)
+        stage_timings["search"] = time.perf_counter() - start
+
+        doc_hits, memory_hits = _split_memory_hits(result_lists, memory.name)
+
+        # Exact identifiers (function names, error codes) are matched by BM25 and fused in
+        lexical_hits = []
+        if HYBRID_RETRIEVAL and doc_collections:
+            start = time.perf_counter()
+            lexical_hits = retrieval.lexical_query_collections(doc_collections, query, top_k)
+            stage_timings["bm25"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        context_hits = _combine_hits(doc_hits, lexical_hits, memory_hits, top_k, user_email)
+        stage_timings["merge"] = time.perf_counter() - start
 
         # If no uploaded document and no memory, fallback to tutorial
-        if not context_chunks:
-            tutorial_results = tutorial.query(query_texts=[query], n_results=top_k)
-            tutorial_chunks = tutorial_results.get("documents", [[]])[0]
-            context_chunks.extend(tutorial_chunks)
+        if not context_hits:
+            start = time.perf_counter()
+            context_hits = retrieval.retrieve([get_collection(DEFAULT_TUTORIAL_COLLECTION)], query_embedding, top_k)
+            stage_timings["tutorial"] = time.perf_counter() - start
 
     except Exception as e:
         print(f"[Context Retrieval Error]: {e}")
         return []
 
-    return context_chunks
+    return context_hits
 
-def query_llm(prompt, model=LLM_MODEL):
-    headers = {"Content-Type": "application/json"}
-    data = {"model": model, "prompt": prompt, "stream": False}
+def retrieve_context(query, top_k=5, collection_names=None, timings=None, query_embedding=None, user_email=None):
+    """Retrieve relevant chunk texts, ranked as described in retrieve_hits."""
+    hits = retrieve_hits(query, top_k=top_k, collection_names=collection_names, timings=timings,
+                         query_embedding=query_embedding, user_email=user_email)
+    return [hit["text"] for hit in hits]
+
+def format_timings(timings: dict) -> str:
+    return ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in timings.items())
+
+def _llm_error_message(e: Exception) -> str:
+    if isinstance(e, (LLMResponseError, LLMBusyError)):
+        return str(e)
+    return f"[Connection Error] Is the local LLM running at {LLM_ENDPOINT}? Error: {e}"
+
+def query_llm(prompt, model=LLM_MODEL, user_email=None, on_queue=None):
+    """Blocking generation once the scheduler grants a slot (see llm_scheduler)."""
     try:
-        # Check if the LLM endpoint is reachable
-        requests.get(f"{LLM_ENDPOINT.rsplit('/', 1)[0]}")
-        response = requests.post(LLM_ENDPOINT, headers=headers, data=json.dumps(data))
-        if response.status_code == 200:
-            return response.json().get("response", "")
-        else:
-            return f"[LLM Error {response.status_code}] {response.text}"
-    except requests.exceptions.RequestException as e:
-        return f"[Connection Error] Is the local LLM running at {LLM_ENDPOINT}? Error: {e}"
-
-def log_to_memory(question: str, answer: str):
-    # Check for empty inputs to prevent errors
-    if not question or not answer:
-        return
+        with get_scheduler().slot(user_email, on_queue=on_queue):
+            return get_llm_client().generate(prompt, model=model)
+    except (LLMError, requests.exceptions.RequestException) as e:
+        return _llm_error_message(e)
 
-    q_hash = make_hash(question)
-    existing_documents = memory.get(where={"answer": answer}).get("documents", [])
-    if any(make_hash(doc) == q_hash for doc in existing_documents):
-        return
+def query_llm_stream(prompt, model=LLM_MODEL, user_email=None, on_queue=None, status=None):
+    """
+    Yield response tokens from Ollama's NDJSON stream as they are generated.
+    Waits for a scheduler slot first; on_queue(position) reports the place in line (0 = generating).
+    On failure the error text is yielded as a final token and status["failed"] is set, since
+    the answer may already hold partial text and so cannot be recognized by its prefix.
+    """
+    try:
+        with get_scheduler().slot(user_email, on_queue=on_queue):
+            yield from get_llm_client().generate_stream(prompt, model=model)
+    except (LLMError, requests.exceptions.RequestException) as e:
+        if status is not None:
+            status["failed"] = True
+        yield _llm_error_message(e)
 
-    uid = str(uuid.uuid4())
-    memory.add(
-        ids=[uid],
-        documents=[question],
-        metadatas=[{"answer": answer}],
-        embeddings=[embed.encode(question).tolist()]
-    )
+def is_error_answer(answer: str) -> bool:
+    return answer.startswith(("[LLM Error", "[LLM Busy", "[Connection Error", "[Timeout"))
+
+def log_to_memory(question: str, answer: str, question_embedding=None, user_email=None):
+    log_qa_pairs([{"question": question, "answer": answer, "embedding": question_embedding,
+                   "user_email": user_email}])
 
 def log_to_postgres(user_email: str, question: str, answer: str):
     try:
-        conn = psycopg2.connect(host=PG_HOST, database=PG_DB, user=PG_USER, password=PG_PASS)
-        cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS chat_history (
-                id SERIAL PRIMARY KEY,
-                user_email TEXT NOT NULL,
-                question TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        cur.execute(
-            "INSERT INTO chat_history (user_email, question, answer) VALUES (%s, %s, %s)",
-            (user_email, question, answer)
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO chat_history (user_email, question, answer) VALUES (%s, %s, %s)",
+                    (user_email, question, answer)
+                )
     except Exception as e:
         print(f"[PostgreSQL Logging Error]: {e}")
 
 def get_chat_history(user_email: str, limit=20):
     try:
-        conn = psycopg2.connect(host=PG_HOST, database=PG_DB, user=PG_USER, password=PG_PASS)
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT question, answer, timestamp
-            FROM chat_history
-            WHERE user_email = %s
-            ORDER BY timestamp DESC
-            LIMIT %s
-        """, (user_email, limit))
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT question, answer, timestamp
+                    FROM chat_history
+                    WHERE user_email = %s
+                    ORDER BY timestamp DESC
+                    LIMIT %s
+                """, (user_email, limit))
+                rows = cur.fetchall()
         return [{"question": row[0], "answer": row[1], "timestamp": row[2].isoformat()} for row in rows]
     except Exception as e:
         print(f"[PostgreSQL Retrieval Error]: {e}")
         return []
 
 # ----------------- Chat Functions -----------------
-def chat_raw(user_input: str, collection_names=None) -> dict:
-    context_chunks = retrieve_context(user_input, collection_names=collection_names)
-    context = "\n\n".join(context_chunks) if context_chunks else "[No relevant memory or document found.]"
+def build_prompt(user_input: str, collection_names=None, timings=None, query_embedding=None, user_email=None) -> str:
+    hits = retrieve_hits(user_input, collection_names=collection_names, timings=timings,
+                         query_embedding=query_embedding, user_email=user_email)
+    return format_prompt(user_input, hits, timings)
 
-    full_prompt = f"""You are a helpful assistant.
+def format_prompt(user_input: str, hits, timings=None) -> str:
+    # Pack the best-ranked chunks into the token budget so the prompt cannot overflow the model
+    start = time.perf_counter()
+    context = build_context(hits) if hits else ""
+    if timings is not None:
+        timings["context"] = time.perf_counter() - start
+    context = context or "[No relevant memory or document found.]"
+
+    return f"""You are a helpful assistant.
 Use CONTEXT and MEMORY to answer the QUESTION clearly and precisely.
 
 ### CONTEXT ###
@@ -163,16 +192,219 @@ Use CONTEXT and MEMORY to answer the QUESTION clearly and precisely.
 
 ### RESPONSE ###
 """
-    ai_response = query_llm(full_prompt)
-    log_to_memory(user_input, ai_response)
-    return {"question": user_input, "answer": ai_response.strip()}
 
-def chat(user_input: str, collection_names=None) -> str:
-    result = chat_raw(user_input, collection_names=collection_names)
+def _embed_and_check_cache(user_input: str, collection_names, timings: dict, user_email=None):
+    start = time.perf_counter()
+    query_embedding = embed_query(user_input)
+    timings["embed"] = time.perf_counter() - start
+
+    cached_answer = answer_cache.lookup(query_embedding, collection_names, user_email=user_email)
+    if cached_answer is not None:
+        print(f"[Answer Cache] Hit ({answer_cache.stats()['hit_rate']:.0%} hit rate)")
+    return query_embedding, cached_answer
+
+def _hit_sources(hits, collection_names, user_email=None):
+    """Logical names of the collections the hits came from (hits carry physical names)."""
+    candidates = list(collection_names or []) + [memory_collection_name(user_email), DEFAULT_TUTORIAL_COLLECTION]
+    by_physical = {resolve_collection_name(name): name for name in candidates}
+    return sorted({by_physical.get(hit["collection"], hit["collection"]) for hit in hits})
+
+def _remember_answer(user_input: str, query_embedding, ai_response: str, collection_names, user_email=None,
+                     failed: bool = False, hits=()):
+    # Failed, truncated or empty answers are neither cached nor remembered
+    if failed or not ai_response or is_error_answer(ai_response):
+        return
+    # The cache entry is dropped once any collection that contributed hits is rebuilt
+    answer_cache.store(user_input, query_embedding, ai_response, collection_names, user_email=user_email,
+                       sources=_hit_sources(hits, collection_names, user_email))
+    # Persisted by the background writer, off the response path
+    write_behind.enqueue_memory(user_input, ai_response, query_embedding, user_email=user_email)
+
+def chat_raw(user_input: str, collection_names=None, user_email=None) -> dict:
+    return run_sync(achat(user_input, collection_names=collection_names, user_email=user_email))
+
+def chat_stream(user_input: str, collection_names=None, on_complete=None, user_email=None, on_queue=None):
+    """
+    Synchronous streaming pipeline (used by the Streamlit UI): yields answer tokens as the LLM produces them.
+    Memory logging (and on_complete(answer), e.g. Postgres logging) runs once the stream finishes,
+    unless the LLM request failed.
+    on_queue(position) is called while the request waits for an LLM slot, and with 0 when it starts.
+    """
+    timings = {}
+    query_embedding, cached_answer = _embed_and_check_cache(user_input, collection_names, timings, user_email=user_email)
+    if cached_answer is not None:
+        yield cached_answer
+        if on_complete:
+            on_complete(cached_answer)
+        return
+
+    hits = retrieve_hits(user_input, collection_names=collection_names, timings=timings,
+                         query_embedding=query_embedding, user_email=user_email)
+    full_prompt = format_prompt(user_input, hits, timings)
+
+    tokens = []
+    status = {"failed": False}
+    start = time.perf_counter()
+    for token in query_llm_stream(full_prompt, user_email=user_email, on_queue=on_queue, status=status):
+        if not tokens:
+            timings["first_token"] = time.perf_counter() - start
+        tokens.append(token)
+        yield token
+    timings["llm"] = time.perf_counter() - start
+
+    ai_response = "".join(tokens).strip()
+    _remember_answer(user_input, query_embedding, ai_response, collection_names, user_email=user_email,
+                     failed=status["failed"], hits=hits)
+    print(f"[Timing] {format_timings(timings)}")
+
+    # Busy rejections and connection errors are shown to the user but are not chat history
+    if on_complete and not status["failed"]:
+        on_complete(ai_response)
+
+def chat(user_input: str, collection_names=None, user_email=None) -> str:
+    result = chat_raw(user_input, collection_names=collection_names, user_email=user_email)
     return result["answer"]
 
+# ----------------- Async Pipeline -----------------
+async def _timed(stage_timings: dict, stage: str, coro):
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        stage_timings[stage] = time.perf_counter() - start
+
+async def aretrieve_hits(query, query_embedding, top_k=5, collection_names=None, timings=None, user_email=None):
+    """
+    Async retrieve_hits, with the same ranking and stage timings: dense search over documents
+    and memory runs concurrently with BM25, and the tutorial is only queried when both are empty.
+    """
+    stage_timings = timings if timings is not None else {}
+    try:
+        doc_collections = [get_collection(name) for name in collection_names or []]
+        memory = get_collection(memory_collection_name(user_email))
+        lookups = [_timed(stage_timings, "search",
+                          retrieval.aquery_collections(doc_collections + [memory], query_embedding, top_k))]
+        if HYBRID_RETRIEVAL and doc_collections:
+            lookups.append(_timed(stage_timings, "bm25",
+                                  retrieval.alexical_query_collections(doc_collections, query, top_k)))
+        result_lists, *lexical = await asyncio.gather(*lookups)
+
+        start = time.perf_counter()
+        doc_hits, memory_hits = _split_memory_hits(result_lists, memory.name)
+        context_hits = _combine_hits(doc_hits, lexical[0] if lexical else [], memory_hits, top_k, user_email)
+        stage_timings["merge"] = time.perf_counter() - start
+
+        # If no uploaded document and no memory, fallback to tutorial
+        if not context_hits:
+            tutorial_lists = await _timed(stage_timings, "tutorial", retrieval.aquery_collections(
+                [get_collection(DEFAULT_TUTORIAL_COLLECTION)], query_embedding, top_k))
+            context_hits = retrieval.merge_top_k(tutorial_lists, top_k)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"[Context Retrieval Error]: {e}")
+        return []
+    return context_hits
+
+async def _achat(user_input: str, collection_names, user_email, on_token, on_queue) -> dict:
+    timings = {}
+    query_embedding, cached_answer = await asyncio.to_thread(
+        _embed_and_check_cache, user_input, collection_names, timings, user_email
+    )
+    if cached_answer is not None:
+        if on_token:
+            on_token(cached_answer)
+        return {"question": user_input, "answer": cached_answer}
+
+    client = get_async_llm_client()
+    # Load the model while retrieval runs; a failure here surfaces again from the real request.
+    # Skipped when the scheduler is about to turn the request away as busy.
+    prefetch = None
+    if LLM_PREFETCH and get_scheduler().would_admit(user_email):
+        prefetch = asyncio.create_task(client.warm())
+        prefetch.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    try:
+        hits = await aretrieve_hits(user_input, query_embedding, collection_names=collection_names,
+                                    timings=timings, user_email=user_email)
+        full_prompt = format_prompt(user_input, hits, timings)
+
+        tokens = []
+        failed = False
+        start = time.perf_counter()
+        try:
+            async with get_scheduler().aslot(user_email, on_queue=on_queue):
+                timings["queue"] = time.perf_counter() - start
+                async for token in client.generate_stream(full_prompt, model=LLM_MODEL):
+                    if not tokens:
+                        timings["first_token"] = time.perf_counter() - start
+                    tokens.append(token)
+                    if on_token:
+                        on_token(token)
+        except (LLMError, httpx.HTTPError) as e:
+            failed = True
+            tokens = [_llm_error_message(e)]
+            if on_token:
+                on_token(tokens[0])
+        timings["llm"] = time.perf_counter() - start
+    finally:
+        if prefetch and not prefetch.done():
+            prefetch.cancel()
+
+    ai_response = "".join(tokens).strip()
+    _remember_answer(user_input, query_embedding, ai_response, collection_names, user_email=user_email,
+                     failed=failed, hits=hits)
+    print(f"[Timing] {format_timings(timings)}")
+    return {"question": user_input, "answer": ai_response}
+
+async def achat(user_input: str, collection_names=None, user_email=None, on_token=None, on_queue=None,
+                deadline: float = CHAT_DEADLINE) -> dict:
+    """
+    Asyncio-native chat: embedding, concurrent retrieval, model prefetch and streamed generation.
+    - on_token: optional callback receiving each answer token as it arrives.
+    - on_queue: optional callback receiving the place in the LLM queue (0 once generating).
+    - deadline: seconds for the whole request; on expiry generation is cancelled and a
+      timeout answer is returned (and not remembered).
+    Cancelling the awaiting task (e.g. the user navigated away) closes the LLM stream,
+    which stops generation, and nothing is logged.
+    """
+    try:
+        return await asyncio.wait_for(_achat(user_input, collection_names, user_email, on_token, on_queue),
+                                      timeout=deadline)
+    except asyncio.TimeoutError:
+        print(f"[Timeout] Chat request exceeded {deadline:.0f}s")
+        return {"question": user_input, "answer": f"[Timeout] No answer within {deadline:.0f}s."}
+
+# Sync entry points share one background event loop, so the async LLM client keeps its pool
+_loop = None
+_loop_lock = threading.Lock()
+
+def _background_loop():
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="chat-async", daemon=True).start()
+                _loop = loop
+    return _loop
+
+def run_sync(coro):
+    """Run a coroutine on the background loop and wait for it; Ctrl-C cancels it."""
+    future = asyncio.run_coroutine_threadsafe(coro, _background_loop())
+    try:
+        return future.result()
+    except KeyboardInterrupt:
+        future.cancel()
+        raise
+
 # ----------------- CLI Entry -----------------
 if __name__ == "__main__":
+    try:
+        run_migrations()
+    except Exception as e:
+        print(f"[PostgreSQL Migration Error]: {e}")
+    load_all_artifacts()
     print(f"Devbot (Private Assistant using DeepSeek-Coder)\\nType 'exit' or 'quit' to end the session.")
     collections_input = input(
         f"Enter comma-separated collection names (leave blank for default '{DEFAULT_TUTORIAL_COLLECTION}'): "
@@ -181,7 +413,7 @@ if __name__ == "__main__":
 
     if active_collections:
         for col_name in active_collections:
-            client.get_or_create_collection(name=col_name)
+            get_collection(col_name)
 
     while True:
         try:
@@ -189,8 +421,10 @@ if __name__ == "__main__":
             if user_input.strip().lower() in {"exit", "quit"}:
                 print("[Goodbye]")
                 break
-            result = chat_raw(user_input, collection_names=active_collections)
-            print(f"\nDevbot: {result['answer']}")
+            print("\nDevbot: ", end="", flush=True)
+            run_sync(achat(user_input, collection_names=active_collections,
+                           on_token=lambda token: print(token, end="", flush=True)))
+            print()
         except KeyboardInterrupt:
             print("\n[Session Ended]")
             break
@@ -1,92 +1,27 @@
-import psycopg2
-from psycopg2 import sql
-import os # Add this missing import
-from datetime import datetime
-
-# Centralize DB Config
-DB_NAME = "devbot_db"
-DB_USER = "devbot_user"
-DB_PASSWORD = "123456"
-DB_HOST = "localhost"
-DB_PORT = "5432"
-
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-# Handle connection error
-try:
-    if DATABASE_URL:
-        conn = psycopg2.connect(DATABASE_URL)
-    else:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT
-        )
-except Exception as e:
-    print(f"Error connecting to PostgreSQL: {e}")
-    conn = None
-
-def get_connection():
-    if conn and not conn.closed:
-        return conn
-    else:
-        try:
-            return psycopg2.connect(
-                dbname=DB_NAME,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                host=DB_HOST,
-                port=DB_PORT
-            )
-        except Exception as e:
-            print(f"Error establishing new PostgreSQL connection: {e}")
-            return None
+from db import get_connection
+from migrations import run_migrations
 
 def init_db():
-    connection = get_connection()
-    if connection is None:
-        return
-    
-    with connection as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS chat_history (
-                    id SERIAL PRIMARY KEY,
-                    timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
-                    user_message TEXT NOT NULL,
-                    bot_response TEXT NOT NULL
-                );
-            """)
-            conn.commit()
+    # The canonical chat_history schema is owned by migrations.py
+    run_migrations()
 
-def save_chat(user_msg: str, bot_msg: str):
-    connection = get_connection()
-    if connection is None:
-        return
-    
-    with connection as conn:
+def save_chat(user_email: str, question: str, answer: str):
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 """
-                INSERT INTO chat_history (user_message, bot_response)
-                VALUES (%s, %s);
+                INSERT INTO chat_history (user_email, question, answer)
+                VALUES (%s, %s, %s);
                 """,
-                (user_msg, bot_msg)
+                (user_email, question, answer)
             )
-            conn.commit()
 
 def load_all_chats(limit=100):
-    connection = get_connection()
-    if connection is None:
-        return []
-
-    with connection as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 """
-                SELECT timestamp, user_message, bot_response
+                SELECT timestamp, user_email, question, answer
                 FROM chat_history
                 ORDER BY timestamp DESC
                 LIMIT %s;
@@ -94,3 +29,35 @@ def load_all_chats(limit=100):
                 (limit,)
             )
             return cur.fetchall()
+
+def load_history_page(user_email: str, limit: int = 20, before=None):
+    """
+    One page of a user's history, newest first, using a keyset cursor.
+    before: (timestamp, id) of the oldest row already loaded; None for the latest page.
+    Returns rows of (id, question, answer, timestamp); served by chat_history_user_ts_idx.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if before is None:
+                cur.execute(
+                    """
+                    SELECT id, question, answer, timestamp
+                    FROM chat_history
+                    WHERE user_email = %s
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT %s;
+                    """,
+                    (user_email, limit)
+                )
+            else:
+                cur.execute(
+                    """
+                    SELECT id, question, answer, timestamp
+                    FROM chat_history
+                    WHERE user_email = %s AND (timestamp, id) < (%s, %s)
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT %s;
+                    """,
+                    (user_email, before[0], before[1], limit)
+                )
+            return cur.fetchall()
@@ -1,72 +1,69 @@
 import streamlit as st
-import psycopg2
 from datetime import datetime
 from auth import login_user
-from chat import chat # Re-importing the updated chat function
+from chat import chat_stream
 import tempfile
+import hashlib
 import os
 from ingest_document import ingest_file
-from config import PG_HOST, PG_DB, PG_USER, PG_PASS # Import PostgreSQL config
-
-# ---------- DB Helper ----------
-def get_db():
-    return psycopg2.connect(
-        host=PG_HOST, database=PG_DB, user=PG_USER, password=PG_PASS
-    )
+from db import pool_stats
+from chat_history import load_history_page
+from config import HISTORY_PAGE_SIZE
+from migrations import run_migrations
+from collection_artifact import load_all_artifacts
+import write_behind
+from embedding_cache import get_embedding_cache
+from embedding_service import get_embedding_service
+from llm_scheduler import get_scheduler
 
 # ---------- Chat History ----------
-def get_chat_history(user_email):
+def reset_history():
+    # Rows are kept oldest-first as (question, answer, timestamp); the cursor points at the oldest loaded row
+    st.session_state["history"] = []
+    st.session_state["history_cursor"] = None
+    st.session_state["history_loaded"] = False
+    st.session_state["history_exhausted"] = False
+
+def load_older_history(user_email):
+    """Fetch the page before the oldest loaded message and prepend it to the cached history."""
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS chat_history (
-                id SERIAL PRIMARY KEY,
-                user_email TEXT NOT NULL,
-                question TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        conn.commit()
-
-        cur.execute("""
-            SELECT question, answer, timestamp
-            FROM chat_history
-            WHERE user_email = %s
-            ORDER BY timestamp ASC
-        """, (user_email,))
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-        return rows
+        rows = load_history_page(user_email, limit=HISTORY_PAGE_SIZE + 1,
+                                 before=st.session_state["history_cursor"])
     except Exception as e:
         st.error(f"Error fetching chat history: {e}")
-        return []
+        return
 
-# ---------- Chat Saver ----------
-def save_chat(user_email, question, answer):
-    try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO chat_history (user_email, question, answer)
-            VALUES (%s, %s, %s)
-        """, (user_email, question, answer))
-        conn.commit()
-        cur.close()
-        conn.close()
-    except Exception as e:
-        st.error(f"Error saving chat: {e}")
+    page = rows[:HISTORY_PAGE_SIZE]
+    st.session_state["history_exhausted"] = len(rows) <= HISTORY_PAGE_SIZE
+    if page:
+        oldest = page[-1]
+        st.session_state["history_cursor"] = (oldest[3], oldest[0])
+        st.session_state["history"] = [(q, a, ts) for _, q, a, ts in reversed(page)] + st.session_state["history"]
+    st.session_state["history_loaded"] = True
 
 # ---------- Streamlit Page Config ----------
 st.set_page_config(page_title="DevBot", layout="wide")
 
+# ---------- Schema ----------
+# Runs the versioned migrations once per process, not on every rerun
+try:
+    run_migrations()
+except Exception as e:
+    st.error(f"Error preparing database schema: {e}")
+
+# ---------- Vectorstore ----------
+# Bulk-loads shipped collection artifacts (e.g. the tutorial) once per process, without the model
+load_all_artifacts()
+
 # ---------- Session Init ----------
 if "user" not in st.session_state:
     st.session_state["user"] = None
 if "active_collections" not in st.session_state:
     st.session_state["active_collections"] = []
+if "ingested_files" not in st.session_state:
+    st.session_state["ingested_files"] = {}
+if "history" not in st.session_state:
+    reset_history()
 
 # ---------- Login ----------
 if not st.session_state["user"]:
@@ -86,32 +83,61 @@ else:
     if st.sidebar.button("Logout"):
         st.session_state["user"] = None
         st.session_state["active_collections"] = []
+        reset_history()
         st.rerun()
 
+    with st.sidebar.expander("Diagnostics"):
+        st.caption("PostgreSQL pool")
+        st.json(pool_stats())
+        st.caption("Write-behind queue")
+        st.json(write_behind.stats())
+        st.caption("Embedding cache")
+        st.json(get_embedding_cache().stats())
+        st.caption("Embedding service")
+        st.json(get_embedding_service().stats())
+        st.caption("LLM scheduler")
+        st.json(get_scheduler().stats())
+
     # ---------- Document Upload ----------
     st.sidebar.subheader("Upload a Document for Context")
     uploaded_file = st.sidebar.file_uploader("Upload PDF/DOCX/TXT/MD", type=["pdf", "docx", "txt", "md"])
     if uploaded_file is not None:
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{uploaded_file.name}") as tmp:
-                tmp.write(uploaded_file.read())
-                tmp_path = tmp.name
+            # The uploader keeps the file across reruns; only ingest content not seen this session
+            file_bytes = uploaded_file.getvalue()
+            file_hash = hashlib.sha256(file_bytes).hexdigest()
+            ingested = st.session_state["ingested_files"]
+            if file_hash not in ingested:
+                with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{uploaded_file.name}") as tmp:
+                    tmp.write(file_bytes)
+                    tmp_path = tmp.name
+                try:
+                    ingested[file_hash] = ingest_file(tmp_path, source_name=uploaded_file.name)
+                finally:
+                    os.unlink(tmp_path)
 
-            collection_name = ingest_file(tmp_path)
+            collection_name = ingested[file_hash]
             if collection_name not in st.session_state["active_collections"]:
                 st.session_state["active_collections"].append(collection_name)
 
             st.sidebar.success(f"Document '{uploaded_file.name}' ingested successfully.")
-            os.unlink(tmp_path)
         except Exception as e:
             st.sidebar.error(f"Error ingesting document: {e}")
 
     st.title("DevBot Chat")
 
-    history = get_chat_history(st.session_state["user"]["email"])
+    user_email = st.session_state["user"]["email"]
+    if not st.session_state["history_loaded"]:
+        load_older_history(user_email)
+
+    if not st.session_state["history_exhausted"]:
+        if st.button("Load older messages"):
+            load_older_history(user_email)
+            st.rerun()
+
     chat_container = st.container()
     with chat_container:
-        for q, a, ts in history:
+        for q, a, ts in st.session_state["history"]:
             st.markdown(f"**You ({ts.strftime('%H:%M:%S')}):** {q}")
             st.markdown(f"**Bot:** {a}")
             st.markdown("---")
@@ -125,12 +151,30 @@ else:
                 st.warning("Please upload at least one document to provide context.")
             else:
                 try:
-                    bot_reply = chat(
+                    def on_complete(answer):
+                        # Persisted by the background writer so the reply is not held up
+                        write_behind.enqueue_chat(user_email, user_input, answer)
+                        # Append locally so the next rerun does not re-query the table
+                        st.session_state["history"].append((user_input, answer, datetime.now()))
+
+                    st.markdown(f"**You:** {user_input}")
+                    st.markdown("**Bot:**")
+                    queue_status = st.empty()
+
+                    def on_queue(position):
+                        if position:
+                            queue_status.info(f"The model is busy; you are number {position} in the queue.")
+                        else:
+                            queue_status.empty()
+
+                    # Render tokens as they arrive; history is saved once the stream has finished
+                    st.write_stream(chat_stream(
                         user_input,
-                        collection_names=st.session_state.get("active_collections")
-                    )
-
-                    save_chat(st.session_state["user"]["email"], user_input, bot_reply)
+                        collection_names=st.session_state.get("active_collections"),
+                        on_complete=on_complete,
+                        user_email=user_email,
+                        on_queue=on_queue
+                    ))
 
                     st.rerun()
                 except Exception as e:
@@ -0,0 +1,178 @@
+# collection_artifact.py
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+import uuid
+import numpy as np
+from config import ARTIFACTS_PATH, EMBED_MODEL_NAME, EMBED_BACKEND, DEFAULT_TUTORIAL_COLLECTION
+from registry import get_collection, collection_exists, delete_collection, swap_alias
+from embedding_pipeline import batched, write_batch_size
+from embedding_backends import model_version
+
+# ----------------- Collection Artifacts -----------------
+# A collection is exported as two files under ARTIFACTS_PATH:
+#   <name>.npy   float16 embedding matrix, one row per chunk
+#   <name>.json  ids, documents, metadatas, collection metadata and a fingerprint
+# Loading writes the stored vectors straight into Chroma, so no model is needed at startup.
+ARTIFACT_FORMAT_VERSION = 2
+
+def artifact_paths(name: str, directory: str = ARTIFACTS_PATH):
+    base = os.path.join(directory, name)
+    return f"{base}.npy", f"{base}.json"
+
+def _fingerprint(ids, documents, embeddings) -> str:
+    digest = hashlib.sha256()
+    for doc_id, document in zip(ids, documents):
+        digest.update(doc_id.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(document.encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(np.ascontiguousarray(embeddings).tobytes())
+    return digest.hexdigest()
+
+# Bookkeeping keys written by the loader; they are not part of the exported collection
+_LOADER_KEYS = {"artifact", "complete"}
+
+# ----------------- Export -----------------
+def export_collection(name: str, directory: str = ARTIFACTS_PATH, page_size: int = 1000) -> dict:
+    """Write a collection's chunks and float16 embeddings to an artifact; returns its header."""
+    collection = get_collection(name)
+    ids, documents, metadatas, vectors = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas", "embeddings"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"] or [None] * len(page["ids"]))
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float16))
+        offset += len(page["ids"])
+
+    if not ids:
+        raise ValueError(f"Collection '{name}' is empty; nothing to export.")
+    embeddings = np.vstack(vectors)
+
+    header = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "collection": name,
+        "collection_metadata": {k: v for k, v in (collection.metadata or {}).items() if k not in _LOADER_KEYS},
+        "model": EMBED_MODEL_NAME,
+        "model_version": model_version(EMBED_BACKEND),
+        "dimension": int(embeddings.shape[1]),
+        "count": len(ids),
+        "fingerprint": _fingerprint(ids, documents, embeddings),
+        "created_at": time.time(),
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    npy_path, json_path = artifact_paths(name, directory)
+    np.save(f"{npy_path}.tmp.npy", embeddings)
+    with open(f"{json_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({**header, "ids": ids, "documents": documents, "metadatas": metadatas}, f)
+    # Vectors first, header last: a header always describes a complete .npy next to it
+    os.replace(f"{npy_path}.tmp.npy", npy_path)
+    os.replace(f"{json_path}.tmp", json_path)
+    print(f"[INFO] Exported {len(ids)} chunks from '{name}' to {npy_path} ({os.path.getsize(npy_path) / 1e6:.1f} MB)")
+    return header
+
+# ----------------- Load -----------------
+def is_loaded(name: str, fingerprint: str) -> bool:
+    if not collection_exists(name):
+        return False
+    metadata = get_collection(name).metadata or {}
+    return metadata.get("artifact") == fingerprint and metadata.get("complete") is True
+
+def load_artifact(name: str, directory: str = ARTIFACTS_PATH, force: bool = False) -> int:
+    """
+    Bulk-load an exported collection into the vectorstore without running the model.
+    Skipped when the collection already holds this exact artifact; returns the chunks written.
+    """
+    npy_path, json_path = artifact_paths(name, directory)
+    with open(json_path, "r", encoding="utf-8") as f:
+        artifact = json.load(f)
+
+    if artifact.get("format_version") != ARTIFACT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format {artifact.get('format_version')} for '{name}'.")
+    if artifact.get("model") != EMBED_MODEL_NAME:
+        raise ValueError(
+            f"Artifact '{name}' was embedded with '{artifact.get('model')}', "
+            f"but the configured model is '{EMBED_MODEL_NAME}'."
+        )
+    if artifact.get("model_version") != model_version(EMBED_BACKEND):
+        raise ValueError(
+            f"Artifact '{name}' was embedded with model version {artifact.get('model_version')}, "
+            f"but the configured {EMBED_BACKEND} model is version {model_version(EMBED_BACKEND)}; re-export it."
+        )
+    fingerprint = artifact["fingerprint"]
+    if not force and is_loaded(name, fingerprint):
+        return 0
+
+    embeddings = np.load(npy_path, mmap_mode="r")
+    if embeddings.shape[0] != len(artifact["ids"]):
+        raise ValueError(f"Artifact '{name}' is inconsistent: {embeddings.shape[0]} vectors, {len(artifact['ids'])} ids.")
+
+    # Load into a side collection and swap it in, so readers never see a half-loaded collection.
+    # The name is unique per load: reloading the live artifact must never target the live collection.
+    side_name = f"{name}__{fingerprint[:12]}_{uuid.uuid4().hex[:8]}"
+    collection_metadata = dict(artifact["collection_metadata"], artifact=fingerprint)
+    collection = get_collection(side_name, metadata=collection_metadata)
+
+    start = time.perf_counter()
+    rows = range(len(artifact["ids"]))
+    for batch in batched(rows, write_batch_size()):
+        first, last = batch[0], batch[-1] + 1
+        metadatas = artifact["metadatas"][first:last]
+        collection.add(
+            ids=artifact["ids"][first:last],
+            documents=artifact["documents"][first:last],
+            embeddings=np.asarray(embeddings[first:last], dtype=np.float32).tolist(),
+            metadatas=metadatas if all(metadatas) else None
+        )
+    collection.modify(metadata=dict(collection_metadata, complete=True))
+    previous = swap_alias(name, side_name)
+    delete_collection(previous, follow_alias=False)
+    print(f"[INFO] Loaded {len(rows)} chunks into '{name}' from artifact in {time.perf_counter() - start:.1f}s")
+    return len(rows)
+
+def available_artifacts(directory: str = ARTIFACTS_PATH):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        filename[:-len(".json")] for filename in os.listdir(directory)
+        if filename.endswith(".json") and os.path.exists(os.path.join(directory, filename[:-len(".json")] + ".npy"))
+    )
+
+_loaded = False
+_load_lock = threading.Lock()
+
+def load_all_artifacts(directory: str = ARTIFACTS_PATH) -> dict:
+    """Load every shipped artifact once per process (startup hook); failures are logged, not raised."""
+    global _loaded
+    with _load_lock:
+        if _loaded:
+            return {}
+        loaded = {}
+        for name in available_artifacts(directory):
+            try:
+                loaded[name] = load_artifact(name, directory)
+            except Exception as e:
+                print(f"[Artifact Error] Could not load '{name}': {e}")
+        _loaded = True
+        return loaded
+
+# ----------------- CLI -----------------
+if __name__ == "__main__":
+    usage = "Usage: python collection_artifact.py export [collection] | load [collection]"
+    if len(sys.argv) < 2 or sys.argv[1] not in {"export", "load"}:
+        print(usage)
+        sys.exit(1)
+    target = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_TUTORIAL_COLLECTION
+    if sys.argv[1] == "export":
+        export_collection(target)
+    else:
+        count = load_artifact(target, force=True)
+        print(f"Loaded {count} chunks into '{target}'.")
@@ -1,34 +1,85 @@
 # config.py
 import os
-import chromadb
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
 
 # ----------------- Paths and Constants -----------------
 VECTORSTORE_PATH = "./vectorstore"
+ARTIFACTS_PATH = "./artifacts"        # exported collections (embeddings + chunks), loaded at startup
 EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
 EMBED_MODEL_PATH = os.path.join("./models", EMBED_MODEL_NAME)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")   # torch | onnx | onnx-int8
+EMBED_ONNX_DIR = os.path.join(EMBED_MODEL_PATH, "onnx")  # exported by `python embedding_backends.py export`
+EMBED_MAX_SEQ_LENGTH = 256
+EMBED_MICRO_BATCH = True          # coalesce concurrent encode calls into one forward pass
+EMBED_BATCH_WAIT_MS = 3           # how long a backlog may wait for more requests to join
+EMBED_MAX_BATCH = 64              # texts per coalesced forward pass
+EMBED_CACHE_MAX_ENTRIES = 10000   # in-process query embedding LRU
+EMBED_CACHE_DTYPE = "float32"     # or "float16" to halve cache memory
+EMBED_CACHE_DISK_PATH = os.getenv("EMBED_CACHE_DISK_PATH")  # e.g. ./vectorstore/embedding_cache.sqlite3; unset disables the disk tier
 
-# PostgreSQL config
+# Collections
+DEFAULT_TUTORIAL_COLLECTION = "python_tutorial"
+MEMORY_COLLECTION = "user_memory"
+
+# PostgreSQL config (DATABASE_URL takes precedence when set, e.g. in docker-compose)
+DATABASE_URL = os.getenv("DATABASE_URL")
 PG_HOST = "localhost"
+PG_PORT = "5432"
 PG_DB = "devbot_db"
 PG_USER = "devbot_user"
 PG_PASS = "123456"
+PG_POOL_MIN = 1
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "5"))   # connections per worker process
+PG_POOL_TIMEOUT = 10                                # seconds to wait for a free connection
+HISTORY_PAGE_SIZE = 20                              # chat messages shown per history page
 
 # LLM Config
 LLM_ENDPOINT = "http://localhost:11434/api/generate"
 LLM_MODEL = "deepseek-coder:6.7b"
+LLM_CONNECT_TIMEOUT = 5     # seconds to establish a connection
+LLM_READ_TIMEOUT = 300      # seconds between bytes; CPU generation is slow
+LLM_POOL_SIZE = 10          # keep-alive connections per process
+LLM_HEALTH_TTL = 30         # seconds a health probe result stays valid
+LLM_BACKOFF_BASE = 2        # seconds; doubled after each consecutive failure
+LLM_BACKOFF_MAX = 60
+LLM_KEEP_ALIVE = 240        # seconds a loaded model is assumed resident (Ollama unloads after 5 min idle)
+LLM_PREFETCH = True         # load the model while retrieval runs (async pipeline)
+CHAT_DEADLINE = 300         # seconds per achat request, retrieval through generation
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", 2))   # generations Ollama runs at once
+LLM_MAX_QUEUE = 32              # waiting requests beyond this are rejected immediately
+LLM_MAX_QUEUED_PER_USER = 3
+LLM_QUEUE_TIMEOUT = 120         # seconds a request may wait for a generation slot
+
+# Embedding pipeline (ingestion)
+EMBED_WRITE_BATCH_SIZE = 256    # chunks embedded and written to Chroma per batch
+EMBED_ENCODE_BATCH_SIZE = 32    # SentenceTransformer forward-pass batch size
+EMBED_PROCESSES = 0             # > 1 to encode with a multi-process pool
+
+# User memory
+MEMORY_NEAR_DUP_DISTANCE = 0.03     # cosine distance under which a new question is a repeat; 0 disables
+MEMORY_MAX_ENTRIES_PER_USER = 2000  # per-user partition capacity; 0 disables eviction
+MEMORY_EVICTION_POLICY = "lru"      # "lru" (least recently hit) or "age" (oldest first)
+MEMORY_COMPACTION_DISTANCE = 0.08   # cosine distance under which compaction merges entries
+
+# Write-behind persistence (chat history + memory)
+WRITE_BEHIND_BATCH_SIZE = 50        # flush when this many writes are queued
+WRITE_BEHIND_FLUSH_INTERVAL = 1.0   # seconds; flush at least this often
+WRITE_BEHIND_MAX_QUEUE = 10000
+
+# Hybrid retrieval (BM25 + vectors)
+HYBRID_RETRIEVAL = True
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60                      # reciprocal rank fusion constant
+LEXICAL_SEGMENT_DOCS = 5000     # chunks buffered per on-disk index segment
+LEXICAL_MAX_SEGMENTS = 8        # segments are merged beyond this
 
-# ----------------- Centralized Setup Objects -----------------
-try:
-    if not os.path.exists(EMBED_MODEL_PATH):
-        raise FileNotFoundError(f"Model not found at {EMBED_MODEL_PATH}")
+# Semantic answer cache
+ANSWER_CACHE_MAX_ENTRIES = 1000
+ANSWER_CACHE_TTL = 6 * 60 * 60      # seconds
+ANSWER_CACHE_MAX_DISTANCE = 0.05    # cosine distance between questions to count as the same
 
-    embed_func = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBED_MODEL_PATH)
-    client = chromadb.PersistentClient(path=VECTORSTORE_PATH)
-    embed = SentenceTransformer(EMBED_MODEL_PATH)
+# Prompt context budget
+CONTEXT_TOKEN_BUDGET = 2048     # tokens of retrieved context per prompt
+CHARS_PER_TOKEN = 4             # estimate used when the tokenizer cannot be loaded
 
-except Exception as e:
-    print(f"Failed to initialize shared ChromaDB or embedding model: {e}")
-    print("Please ensure the model is manually downloaded to the './models' directory.")
-    exit(1)
+# Shared model and ChromaDB objects are created lazily in registry.py
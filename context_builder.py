@@ -0,0 +1,114 @@
+# context_builder.py
+import os
+import threading
+from config import EMBED_MODEL_PATH, CONTEXT_TOKEN_BUDGET, CHARS_PER_TOKEN
+
+# ----------------- Token Counting -----------------
+# The LLM's own tokenizer is not available locally; the MiniLM tokenizer shipped in ./models
+# is a close enough proxy for budgeting, with a characters-per-token estimate as fallback.
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+_tokenizer_failed = False
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_failed
+    if _tokenizer is None and not _tokenizer_failed:
+        with _tokenizer_lock:
+            if _tokenizer is None and not _tokenizer_failed:
+                try:
+                    from tokenizers import Tokenizer
+                    tokenizer = Tokenizer.from_file(os.path.join(EMBED_MODEL_PATH, "tokenizer.json"))
+                    tokenizer.no_truncation()
+                    tokenizer.no_padding()
+                    _tokenizer = tokenizer
+                except Exception as e:
+                    print(f"[Context Builder] Falling back to character-based token estimates: {e}")
+                    _tokenizer_failed = True
+    return _tokenizer
+
+def count_tokens(text: str) -> int:
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+# ----------------- Chunk Merging -----------------
+def _overlap(left: str, right: str, max_overlap: int = 300) -> int:
+    """Length of the longest suffix of left that is a prefix of right (splitter overlap)."""
+    for size in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+def merge_adjacent(hits):
+    """
+    Merge hits that are consecutive chunks of the same document into one passage,
+    dropping the overlap the splitter repeated. The merged passage takes the rank of its
+    best-ranked chunk.
+    """
+    passages = []
+    by_position = {}
+    for rank, hit in enumerate(hits):
+        index = hit.get("metadata", {}).get("chunk_index")
+        passage = {"rank": rank, "collection": hit["collection"], "metadata": hit.get("metadata", {}),
+                   "first": index, "last": index, "text": hit["text"]}
+        passages.append(passage)
+        if index is not None:
+            by_position[(hit["collection"], index)] = passage
+
+    merged = True
+    while merged:
+        merged = False
+        for passage in passages:
+            if passage.get("absorbed") or passage["last"] is None:
+                continue
+            following = by_position.get((passage["collection"], passage["last"] + 1))
+            if following is None or following is passage or following.get("absorbed"):
+                continue
+            overlap = _overlap(passage["text"], following["text"])
+            passage["text"] += following["text"][overlap:] if overlap else "\n" + following["text"]
+            passage["last"] = following["last"]
+            passage["rank"] = min(passage["rank"], following["rank"])
+            by_position[(passage["collection"], passage["last"])] = passage
+            following["absorbed"] = True
+            merged = True
+
+    return sorted((p for p in passages if not p.get("absorbed")), key=lambda p: p["rank"])
+
+# ----------------- Context Assembly -----------------
+def format_passage(passage) -> str:
+    metadata = passage["metadata"]
+    if "answer" in metadata:
+        # Memory entries store the question as the document and the answer in metadata
+        return f"[memory]\nQ: {passage['text']}\nA: {metadata['answer']}"
+    label = passage["collection"]
+    if metadata.get("page") is not None:
+        label += f", p. {metadata['page']}"
+    return f"[{label}]\n{passage['text']}"
+
+def build_context(hits, token_budget: int = CONTEXT_TOKEN_BUDGET, stats: dict = None) -> str:
+    """
+    Pack the best-ranked passages into at most token_budget tokens.
+    hits must already be in priority order; adjacent chunks of a document are merged first.
+    Passages that do not fit are skipped so a smaller, lower-ranked one can still be used.
+    stats (optional) receives kept/dropped passage and token counts.
+    """
+    kept, used = [], 0
+    dropped, dropped_tokens = 0, 0
+    for passage in merge_adjacent(hits):
+        text = format_passage(passage)
+        tokens = count_tokens(text)
+        if used + tokens > token_budget:
+            dropped += 1
+            dropped_tokens += tokens
+            continue
+        kept.append(text)
+        used += tokens
+
+    summary = {"kept": len(kept), "kept_tokens": used, "dropped": dropped,
+               "dropped_tokens": dropped_tokens, "budget": token_budget}
+    if stats is not None:
+        stats.update(summary)
+    print(f"[Context] kept {len(kept)} passages ({used} tokens), "
+          f"dropped {dropped} ({dropped_tokens} tokens), budget {token_budget}")
+    return "\n\n".join(kept)
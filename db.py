@@ -0,0 +1,96 @@
+# db.py
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from config import (
+    DATABASE_URL, PG_HOST, PG_PORT, PG_DB, PG_USER, PG_PASS,
+    PG_POOL_MIN, PG_POOL_MAX, PG_POOL_TIMEOUT,
+)
+
+# ----------------- Shared Connection Pool -----------------
+# One pool per process (i.e. per Streamlit worker); every module borrows from it
+# instead of opening and authenticating a new connection per call.
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PG_POOL_MAX)
+_stats_lock = threading.Lock()
+_stats = {"checkouts": 0, "in_use": 0, "peak_in_use": 0, "timeouts": 0, "discarded": 0, "wait_seconds": 0.0}
+
+def get_pool() -> ThreadedConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if DATABASE_URL:
+                    _pool = ThreadedConnectionPool(PG_POOL_MIN, PG_POOL_MAX, dsn=DATABASE_URL)
+                else:
+                    _pool = ThreadedConnectionPool(
+                        PG_POOL_MIN, PG_POOL_MAX,
+                        host=PG_HOST, port=PG_PORT, database=PG_DB, user=PG_USER, password=PG_PASS
+                    )
+    return _pool
+
+@contextmanager
+def get_connection():
+    """
+    Borrow a pooled connection; commits on success, rolls back on error.
+    Waits up to PG_POOL_TIMEOUT seconds for a free connection instead of failing immediately.
+    """
+    start = time.perf_counter()
+    if not _slots.acquire(timeout=PG_POOL_TIMEOUT):
+        with _stats_lock:
+            _stats["timeouts"] += 1
+        raise PoolError(f"No PostgreSQL connection available within {PG_POOL_TIMEOUT}s")
+
+    pool = None
+    conn = None
+    broken = False
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+        with _stats_lock:
+            _stats["checkouts"] += 1
+            _stats["in_use"] += 1
+            _stats["peak_in_use"] = max(_stats["peak_in_use"], _stats["in_use"])
+            _stats["wait_seconds"] += time.perf_counter() - start
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        if conn is not None:
+            # Connections that lost the server are closed rather than handed out again
+            broken = broken or bool(conn.closed)
+            pool.putconn(conn, close=broken)
+            with _stats_lock:
+                _stats["in_use"] -= 1
+                if broken:
+                    _stats["discarded"] += 1
+        _slots.release()
+
+def pool_stats() -> dict:
+    """Pool utilization metrics for this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["min_size"] = PG_POOL_MIN
+    stats["max_size"] = PG_POOL_MAX
+    stats["utilization"] = stats["in_use"] / PG_POOL_MAX
+    stats["avg_wait_ms"] = stats["wait_seconds"] * 1000 / stats["checkouts"] if stats["checkouts"] else 0.0
+    if _pool is not None:
+        stats["idle"] = len(_pool._pool)
+        stats["open"] = len(_pool._pool) + len(_pool._used)
+    return stats
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
@@ -0,0 +1,165 @@
+# embedding_backends.py
+import os
+import sys
+import json
+import hashlib
+import functools
+import numpy as np
+from config import EMBED_MODEL_NAME, EMBED_MODEL_PATH, EMBED_ONNX_DIR, EMBED_MAX_SEQ_LENGTH
+
+# ----------------- Embedding Backends -----------------
+# Every backend exposes the subset of the SentenceTransformer API this repo uses:
+# encode(str | list[str], batch_size=...) -> np.ndarray of L2-normalized float32 vectors.
+#   torch      SentenceTransformer (PyTorch) - the reference implementation
+#   onnx       ONNX Runtime on the same weights, no torch import at query time
+#   onnx-int8  ONNX Runtime with dynamically quantized int8 weights
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_MODEL_FILES = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+
+def onnx_model_path(backend: str) -> str:
+    return os.path.join(EMBED_ONNX_DIR, ONNX_MODEL_FILES[backend])
+
+class OnnxEmbedder:
+    """MiniLM forward pass in ONNX Runtime, followed by the model's mean pooling and normalization."""
+
+    def __init__(self, model_path: str, model_dir: str = EMBED_MODEL_PATH, max_seq_length: int = EMBED_MAX_SEQ_LENGTH):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"ONNX model not found at {model_path}. Run `python embedding_backends.py export` first."
+            )
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        # Pad each batch to its longest sequence instead of the fixed length in tokenizer.json
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Batch similar lengths together so little compute is spent on padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            encoded = self._encode_batch([texts[i] for i in batch])
+            if embeddings.shape[1] == 0:
+                embeddings = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+            embeddings[batch] = encoded
+        return embeddings[0] if single else embeddings
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self._encode_batch([""]).shape[1])
+
+def load_embedder(backend: str):
+    """Instantiate the configured embedding backend from the local model directory."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'; expected one of {', '.join(BACKENDS)}.")
+    if not os.path.exists(EMBED_MODEL_PATH):
+        raise FileNotFoundError(
+            f"Model not found at {EMBED_MODEL_PATH}. "
+            "Please ensure the model is manually downloaded to the './models' directory."
+        )
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(EMBED_MODEL_PATH)
+    return OnnxEmbedder(onnx_model_path(backend))
+
+# Files SentenceTransformer reads from the model directory, besides its module subfolders
+TORCH_MODEL_FILES = (
+    "modules.json", "config_sentence_transformers.json", "sentence_bert_config.json", "config.json",
+    "model.safetensors", "pytorch_model.bin", "tokenizer.json", "tokenizer_config.json",
+    "special_tokens_map.json", "vocab.txt",
+)
+
+def _loaded_files(backend: str):
+    """Model files the backend reads; docs, other backends' exports and caches are left out."""
+    if backend != "torch":
+        return [onnx_model_path(backend), os.path.join(EMBED_MODEL_PATH, "tokenizer.json")]
+    paths = [os.path.join(EMBED_MODEL_PATH, filename) for filename in TORCH_MODEL_FILES]
+    modules_path = os.path.join(EMBED_MODEL_PATH, "modules.json")
+    if os.path.exists(modules_path):
+        with open(modules_path, "r", encoding="utf-8") as f:
+            module_dirs = [module["path"] for module in json.load(f) if module.get("path")]
+        for module_dir in module_dirs:
+            for root, dirs, files in os.walk(os.path.join(EMBED_MODEL_PATH, module_dir)):
+                dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+                paths.extend(os.path.join(root, filename) for filename in sorted(files))
+    return paths
+
+@functools.lru_cache(maxsize=None)
+def model_version(backend: str) -> str:
+    """
+    Content hash of the backend and the model files it loads; cached embeddings are only
+    valid for the version that produced them. Computed once per process.
+    """
+    digest = hashlib.sha256(f"{backend}:{EMBED_MODEL_NAME}".encode("utf-8"))
+    for path in _loaded_files(backend):
+        digest.update(os.path.relpath(path, EMBED_MODEL_PATH).encode("utf-8"))
+        if not os.path.exists(path):
+            digest.update(b"\0missing")
+            continue
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+# ----------------- Export -----------------
+def export_onnx(opset: int = 14):
+    """Export the local MiniLM weights to ONNX and write an int8 dynamically quantized copy."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(EMBED_ONNX_DIR, exist_ok=True)
+    model = AutoModel.from_pretrained(EMBED_MODEL_PATH).eval()
+    tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL_PATH)
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in names),
+            onnx_model_path("onnx"),
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    quantize_dynamic(onnx_model_path("onnx"), onnx_model_path("onnx-int8"), weight_type=QuantType.QInt8)
+    for backend in ("onnx", "onnx-int8"):
+        path = onnx_model_path(backend)
+        print(f"[INFO] Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+# ----------------- CLI -----------------
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "export":
+        print("Usage: python embedding_backends.py export")
+        sys.exit(1)
+    export_onnx()
@@ -0,0 +1,175 @@
+# embedding_cache.py
+import re
+import os
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import (
+    EMBED_BACKEND, EMBED_CACHE_MAX_ENTRIES, EMBED_CACHE_DTYPE, EMBED_CACHE_DISK_PATH,
+)
+from embedding_backends import model_version
+
+# ----------------- Embedding Cache -----------------
+def normalize_text(text: str) -> str:
+    # MiniLM's tokenizer is uncased and ignores repeated whitespace, so this does not change the vector
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+class _DiskTier:
+    """SQLite table of key -> raw vector bytes, wiped when the model version changes."""
+
+    def __init__(self, path: str, version: str, dtype):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.dtype = dtype
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or row[0] != f"{version}:{np.dtype(dtype).name}":
+                self._conn.execute("DELETE FROM embeddings")
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                                   (f"{version}:{np.dtype(dtype).name}",))
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", list(keys)
+            ).fetchall()
+        return {key: np.frombuffer(blob, dtype=self.dtype) for key, blob in rows}
+
+    def put_many(self, items):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=self.dtype).tobytes()) for key, vector in items]
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM embeddings")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+class EmbeddingCache:
+    """
+    LRU cache of text embeddings keyed by a hash of the normalized text, with an optional
+    on-disk tier shared across processes and restarts. Keys are scoped to the model version,
+    so switching backend or model never returns stale vectors.
+    """
+
+    def __init__(self, max_entries: int = EMBED_CACHE_MAX_ENTRIES, dtype: str = EMBED_CACHE_DTYPE,
+                 disk_path: str = EMBED_CACHE_DISK_PATH, backend: str = EMBED_BACKEND):
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self.version = model_version(backend)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = _DiskTier(disk_path, self.version, self.dtype) if disk_path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key: str, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def encode(self, texts, encode=None, batch_size: int = 32, keep_in_memory: bool = True):
+        """
+        Return float32 embeddings (one row per text), encoding only the texts not cached.
+        - encode: callable(list[str], batch_size) -> vectors; defaults to the micro-batching
+          embedding service.
+        - keep_in_memory=False serves bulk work (ingestion) from the cache without letting it
+          evict hot queries; its vectors still go to the disk tier.
+        """
+        texts = list(texts)
+        keys = [text_key(text) for text in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+            self.memory_hits += sum(1 for key in keys if key in found)
+
+        if self._disk is not None:
+            on_disk = self._disk.get_many([key for key in set(keys) if key not in found])
+            with self._lock:
+                self.disk_hits += sum(1 for key in keys if key in on_disk)
+                if keep_in_memory:
+                    for key, vector in on_disk.items():
+                        self._remember(key, vector)
+            found.update(on_disk)
+
+        missing = {}
+        for text, key in zip(texts, keys):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            if encode is None:
+                from embedding_service import encode
+            vectors = np.asarray(encode(list(missing.values()), batch_size), dtype=np.float32)
+            encoded = {key: vector.astype(self.dtype) for key, vector in zip(missing, vectors)}
+            with self._lock:
+                self.misses += sum(1 for key in keys if key in missing)
+                if keep_in_memory:
+                    for key, vector in encoded.items():
+                        self._remember(key, vector)
+            if self._disk is not None:
+                self._disk.put_many(encoded.items())
+            found.update(encoded)
+
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack([np.asarray(found[key], dtype=np.float32) for key in keys])
+
+    def encode_one(self, text: str):
+        return self.encode([text])[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "disk_entries": len(self._disk) if self._disk is not None else None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "model_version": self.version,
+            }
+
+# Shared by retrieval, memory logging and ingestion in this process
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
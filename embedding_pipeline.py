@@ -0,0 +1,83 @@
+# embedding_pipeline.py
+import time
+from itertools import islice
+from config import EMBED_WRITE_BATCH_SIZE, EMBED_ENCODE_BATCH_SIZE, EMBED_PROCESSES
+from registry import get_client, get_embedder
+from embedding_cache import get_embedding_cache
+import embedding_service
+
+# ----------------- Batching Helpers -----------------
+def batched(iterable, size: int):
+    """Yield lists of at most size items without materializing the whole iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def write_batch_size(requested: int = EMBED_WRITE_BATCH_SIZE) -> int:
+    """Clamp a write batch to the largest batch the Chroma backend accepts."""
+    client = get_client()
+    try:
+        limit = client.get_max_batch_size()
+    except AttributeError:
+        limit = getattr(client, "max_batch_size", None)
+    return min(requested, limit) if limit else requested
+
+# ----------------- Encoding -----------------
+def encode_texts(texts, encode_batch_size: int = EMBED_ENCODE_BATCH_SIZE, pool=None):
+    """
+    Encode through the shared embedding cache; bulk chunks skip its in-memory tier and
+    queue behind interactive queries in the embedding service.
+    """
+    encode = lambda batch, size: embedding_service.encode(batch, size, bulk=True)
+    if pool is not None:
+        encode = lambda batch, size: get_embedder().encode_multi_process(batch, pool, batch_size=size)
+    return get_embedding_cache().encode(texts, encode=encode, batch_size=encode_batch_size,
+                                        keep_in_memory=False).tolist()
+
+def print_progress(done: int, total, elapsed: float):
+    rate = done / elapsed if elapsed else 0.0
+    of_total = f"/{total}" if total else ""
+    print(f"[INFO] Embedded {done}{of_total} chunks ({rate:.1f} chunks/s)")
+
+# ----------------- Pipeline -----------------
+def embed_and_store(collection, records, batch_size: int = EMBED_WRITE_BATCH_SIZE,
+                    encode_batch_size: int = EMBED_ENCODE_BATCH_SIZE, processes: int = EMBED_PROCESSES,
+                    total: int = None, progress=print_progress) -> int:
+    """
+    Embed records in fixed-size batches and write each batch to Chroma as soon as it is encoded.
+    - records: iterable of {"id", "document", optional "metadata"} dicts; it is consumed lazily,
+      so peak memory is one batch of text and vectors regardless of document size.
+    - processes: > 1 encodes with a SentenceTransformer multi-process pool (torch backend only).
+    - progress: callback(done, total, elapsed_seconds), or None to stay quiet.
+    Returns the number of records stored.
+    """
+    batch_size = write_batch_size(batch_size)
+    pool = None
+    if processes and processes > 1:
+        if hasattr(get_embedder(), "start_multi_process_pool"):
+            pool = get_embedder().start_multi_process_pool(target_devices=["cpu"] * processes)
+        else:
+            print("[INFO] Multi-process encoding needs the torch backend; encoding in-process.")
+
+    done = 0
+    start = time.perf_counter()
+    try:
+        for batch in batched(records, batch_size):
+            documents = [record["document"] for record in batch]
+            metadatas = [record.get("metadata") for record in batch]
+            collection.add(
+                ids=[record["id"] for record in batch],
+                documents=documents,
+                embeddings=encode_texts(documents, encode_batch_size, pool),
+                metadatas=metadatas if all(metadatas) else None
+            )
+            done += len(batch)
+            if progress:
+                progress(done, total, time.perf_counter() - start)
+    finally:
+        if pool is not None:
+            get_embedder().stop_multi_process_pool(pool)
+    return done
@@ -0,0 +1,148 @@
+# embedding_service.py
+import queue
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from config import EMBED_MICRO_BATCH, EMBED_BATCH_WAIT_MS, EMBED_MAX_BATCH, EMBED_ENCODE_BATCH_SIZE
+from registry import get_embedder
+
+# ----------------- Micro-batching Embedding Service -----------------
+# Every Streamlit session in this process hands its texts to one encoder thread, which runs
+# whatever is waiting as a single forward pass instead of many batch-of-one passes that
+# fight over the same cores and the GIL. An idle service dispatches immediately, so a lone
+# request pays no batching delay; the wait window only opens once requests are queuing up.
+# Requests are cut into slices of at most max_batch texts, and interactive slices (queries)
+# always go before bulk ones (ingestion), so a query waits for at most one bulk slice.
+INTERACTIVE, BULK = 0, 1
+
+class _Request:
+    """One caller's texts; its future resolves once every slice has been encoded."""
+
+    def __init__(self, parts: int):
+        self.future = Future()
+        self.parts = [None] * parts
+        self.remaining = parts
+
+    def set_part(self, index: int, vectors) -> bool:
+        self.parts[index] = vectors
+        self.remaining -= 1
+        if self.remaining:
+            return False
+        self.future.set_result(self.parts[0] if len(self.parts) == 1 else np.vstack(self.parts))
+        return True
+
+class EmbeddingService:
+    def __init__(self, wait_ms: float = EMBED_BATCH_WAIT_MS, max_batch: int = EMBED_MAX_BATCH):
+        self.wait = wait_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.PriorityQueue()   # (priority, seq, texts, batch_size, request, part)
+        self._seq = itertools.count()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats = {"requests": 0, "bulk_requests": 0, "texts": 0, "batches": 0,
+                       "max_batch_texts": 0, "errors": 0}
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._thread_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+                    self._thread.start()
+
+    def encode(self, texts, batch_size: int = EMBED_ENCODE_BATCH_SIZE, bulk: bool = False):
+        """
+        Embed texts (float32, one row per text), sharing a forward pass with concurrent callers.
+        bulk=True queues the texts behind every interactive request.
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        self._ensure_started()
+        slices = [texts[start:start + self.max_batch] for start in range(0, len(texts), self.max_batch)]
+        request = _Request(len(slices))
+        priority = BULK if bulk else INTERACTIVE
+        for part, texts_slice in enumerate(slices):
+            self._queue.put((priority, next(self._seq), texts_slice, batch_size, request, part))
+        return request.future.result()
+
+    def _collect(self):
+        items = [self._queue.get()]
+        size = len(items[0][2])
+        # Take everything already waiting; if there was a backlog, linger briefly for more
+        deadline = None
+        while size < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                if len(items) == 1 or self.wait <= 0:
+                    break
+                if deadline is None:
+                    deadline = time.monotonic() + self.wait
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if size + len(item[2]) > self.max_batch:
+                # Keeps its place in line (same priority and sequence number) for the next pass
+                self._queue.put(item)
+                break
+            items.append(item)
+            size += len(item[2])
+        # Slices of a request that already failed are dropped
+        return [item for item in items if not item[4].future.done()]
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            if not items:
+                continue
+            texts = [text for _, _, item_texts, _, _, _ in items for text in item_texts]
+            batch_size = max(item[3] for item in items)
+            try:
+                vectors = np.asarray(
+                    get_embedder().encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32
+                )
+            except Exception as e:
+                self._stats["errors"] += 1
+                for item in items:
+                    if not item[4].future.done():
+                        item[4].future.set_exception(e)
+                continue
+
+            start = 0
+            for priority, _, item_texts, _, request, part in items:
+                if request.set_part(part, vectors[start:start + len(item_texts)]):
+                    self._stats["requests"] += 1
+                    self._stats["bulk_requests"] += priority == BULK
+                start += len(item_texts)
+            self._stats["texts"] += len(texts)
+            self._stats["batches"] += 1
+            self._stats["max_batch_texts"] = max(self._stats["max_batch_texts"], len(texts))
+
+    def stats(self) -> dict:
+        batches = self._stats["batches"]
+        return dict(self._stats, queued=self._queue.qsize(),
+                    avg_texts_per_batch=self._stats["texts"] / batches if batches else 0.0)
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_embedding_service() -> EmbeddingService:
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService()
+    return _service
+
+def encode(texts, batch_size: int = EMBED_ENCODE_BATCH_SIZE, bulk: bool = False):
+    """Process-wide encode entry point; micro-batched unless EMBED_MICRO_BATCH is off."""
+    if not EMBED_MICRO_BATCH:
+        return np.asarray(get_embedder().encode(list(texts), batch_size=batch_size, convert_to_numpy=True),
+                          dtype=np.float32)
+    return get_embedding_service().encode(texts, batch_size, bulk=bulk)
@@ -1,43 +1,103 @@
-import os
 import re
-import chromadb
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
+import sys
+import json
+import hashlib
 from pathlib import Path
-from chromadb import PersistentClient
+from config import DEFAULT_TUTORIAL_COLLECTION
+from registry import get_collection, collection_exists, delete_collection, swap_alias
+from embedding_pipeline import batched, write_batch_size, encode_texts
 
 # Config
 TUTORIAL_PATH = Path("tutorials/python_tutorial.md")
-CHUNK_SIZE = 300  # characters per chunk
-COLLECTION_NAME = "python_tutorial"
+COLLECTION_NAME = DEFAULT_TUTORIAL_COLLECTION
 
-# Load tutorial
-with open(TUTORIAL_PATH, "r", encoding="utf-8") as f:
-    content = f.read()
+_HEADER_RE = re.compile(r"^(#+) +(.*)$")
 
-# Split on any header line like #, ##, ###, etc.
-chunks = re.split(r'\n(?=#+ )', content.strip())
+# ----------------- Sections -----------------
+def split_sections(content: str):
+    """
+    Split markdown on header lines. Each section is keyed by its header path
+    (e.g. "Data Structures > Lists"), so its ID survives edits elsewhere in the file.
+    """
+    sections = []
+    path = []
+    seen = {}
+    for chunk in re.split(r'\n(?=#+ )', content.strip()):
+        match = _HEADER_RE.match(chunk.split("\n", 1)[0])
+        if match:
+            level = len(match.group(1))
+            path = path[:level - 1] + [match.group(2).strip()]
+        header_path = " > ".join(path)
+        # Repeated headers under the same parent get an occurrence suffix
+        occurrence = seen.get(header_path, 0)
+        seen[header_path] = occurrence + 1
+        key = header_path if not occurrence else f"{header_path} #{occurrence}"
+        sections.append({
+            "id": "section_" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32],
+            "document": chunk,
+            "header_path": header_path,
+            "content_hash": hashlib.sha256(chunk.encode("utf-8")).hexdigest(),
+        })
+    return sections
 
-# Setup ChromaDB client
-client = PersistentClient(path="./vectorstore")
+def _section_metadata(section, index: int) -> dict:
+    return {"source": COLLECTION_NAME, "chunk_index": index,
+            "header_path": section["header_path"], "content_hash": section["content_hash"]}
 
-# Optional: clean old collection if it exists
-try:
-    client.delete_collection(COLLECTION_NAME)
-except:
-    pass
+# ----------------- Incremental Rebuild -----------------
+def _live_sections(name: str) -> dict:
+    """Current sections of the live collection: id -> (metadata, embedding)."""
+    if not collection_exists(name):
+        return {}
+    found = get_collection(name).get(include=["metadatas", "embeddings"])
+    return {
+        doc_id: (metadata or {}, embedding)
+        for doc_id, metadata, embedding in zip(found["ids"], found["metadatas"], found["embeddings"])
+    }
 
-# Load embedding model
-embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+def index_tutorial(path: Path = TUTORIAL_PATH, name: str = COLLECTION_NAME) -> dict:
+    """
+    Re-embed only sections whose text changed, build the full collection on the side
+    (unchanged sections keep their stored vectors) and swap it in atomically.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        sections = split_sections(f.read())
 
-# Create collection and add documents
-collection = client.create_collection(name=COLLECTION_NAME, embedding_function=embedding_func)
+    live = _live_sections(name)
+    records = [dict(section, metadata=_section_metadata(section, i)) for i, section in enumerate(sections)]
+    changed = [r for r in records
+               if r["id"] not in live or live[r["id"]][0].get("content_hash") != r["content_hash"]]
+    stats = {"sections": len(records), "embedded": len(changed), "reused": len(records) - len(changed),
+             "removed": len(set(live) - {r["id"] for r in records})}
+    if len(live) == len(records) and all(r["id"] in live and live[r["id"]][0] == r["metadata"] for r in records):
+        print(f"Tutorial unchanged; '{name}' already holds all {len(records)} sections.")
+        return stats
 
-for i, chunk in enumerate(chunks):
-    collection.add(
-        documents=[chunk],
-        metadatas=[{"source": "python_tutorial", "chunk_id": i}],
-        ids=[f"chunk_{i}"]
-    )
+    # Named after its content, so it can never be the live collection (that one would be unchanged)
+    build_hash = hashlib.sha256(json.dumps([r["metadata"] for r in records]).encode("utf-8")).hexdigest()
+    side_name = f"{name}__{build_hash[:12]}"
+    delete_collection(side_name)
+    side = get_collection(side_name, metadata={"source": str(path)})
 
-print(f"Indexed {len(chunks)} chunks from the tutorial.")
+    changed_ids = {r["id"] for r in changed}
+    for batch in batched(records, write_batch_size()):
+        to_embed = [r["document"] for r in batch if r["id"] in changed_ids]
+        fresh = iter(encode_texts(to_embed) if to_embed else [])
+        side.add(
+            ids=[r["id"] for r in batch],
+            documents=[r["document"] for r in batch],
+            embeddings=[next(fresh) if r["id"] in changed_ids else [float(x) for x in live[r["id"]][1]] for r in batch],
+            metadatas=[r["metadata"] for r in batch]
+        )
+
+    previous = swap_alias(name, side_name)
+    if previous != side_name:
+        delete_collection(previous, follow_alias=False)
+    return stats
+
+# ----------------- CLI -----------------
+if __name__ == "__main__":
+    tutorial_path = Path(sys.argv[1]) if len(sys.argv) > 1 else TUTORIAL_PATH
+    result = index_tutorial(tutorial_path)
+    print(f"Indexed {result['sections']} sections from the tutorial "
+          f"({result['embedded']} embedded, {result['reused']} reused, {result['removed']} removed).")
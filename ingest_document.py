@@ -1,32 +1,49 @@
 import os
-import sys
-import uuid
+import glob
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import re
+import hashlib
 import fitz
 import docx2txt
 from pathlib import Path
 from langchain.text_splitter import RecursiveCharacterTextSplitter, Language
-# Import shared objects from the config file
-from config import client, embed_func
+# Shared, lazily loaded model and ChromaDB client
+from registry import get_collection, list_collection_names
+from embedding_pipeline import batched, embed_and_store, write_batch_size
+import lexical_index
 
 # ----------------- Text Extraction -----------------
-def extract_text(file_path: str) -> str:
+def extract_pages(file_path: str):
+    """
+    Yield (page_number, text) one page at a time so a large PDF is never held in memory whole.
+    Formats without pages are yielded as a single page 1.
+    """
     ext = Path(file_path).suffix.lower()
-    text = ""
     if ext == ".pdf":
-        doc = fitz.open(file_path)
-        for page in doc:
-            text += page.get_text()
+        with fitz.open(file_path) as doc:
+            for page_number, page in enumerate(doc, start=1):
+                yield page_number, page.get_text()
     elif ext in [".docx", ".doc"]:
-        text = docx2txt.process(file_path)
+        yield 1, docx2txt.process(file_path)
     elif ext in [".txt", ".md", ".py", ".html", ".js", ".json", ".xml"]:
         with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-            text = f.read()
+            yield 1, f.read()
     else:
         raise ValueError(f"Unsupported file format: {ext}")
-    return text
+
+def extract_text(file_path: str) -> str:
+    return "".join(text for _, text in extract_pages(file_path))
 
 # ----------------- Text Splitting -----------------
-def split_text(text: str, file_type: str):
+def get_splitter(file_type: str):
     # Use a specialized splitter for programming languages
     if file_type in [".py", ".js", ".md", ".json"]:
         lang = {
@@ -35,62 +52,308 @@ def split_text(text: str, file_type: str):
             ".md": Language.MARKDOWN,
             ".json": Language.JSON,
         }.get(file_type)
-        splitter = RecursiveCharacterTextSplitter.from_language(
+        return RecursiveCharacterTextSplitter.from_language(
             language=lang, chunk_size=1000, chunk_overlap=100
         )
-    else:
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=100,
-            separators=["\n\n", "\n", ".", " ", ""],
-        )
-    
-    return splitter.split_text(text)
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=100,
+        separators=["\n\n", "\n", ".", " ", ""],
+    )
+
+def split_text(text: str, file_type: str):
+    return get_splitter(file_type).split_text(text)
+
+def split_pages(pages, file_type: str):
+    """Streaming splitter: yields (chunk, metadata) with the page number and chunk position recorded."""
+    splitter = get_splitter(file_type)
+    chunk_index = 0
+    for page_number, text in pages:
+        for chunk in splitter.split_text(text):
+            yield chunk, {"page": page_number, "chunk_index": chunk_index}
+            chunk_index += 1
+
+# ----------------- Content Hashing -----------------
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:32]
+
+def collection_prefix(source_name: str) -> str:
+    # Chroma names allow [a-zA-Z0-9._-], 3-63 chars, alphanumeric at both ends
+    stem = re.sub(r"[^a-zA-Z0-9._-]+", "_", Path(source_name).stem)[:40].strip("._-") or "file"
+    return f"doc_{stem}_"
+
+def collection_name_for(source_name: str, file_hash: str) -> str:
+    return f"{collection_prefix(source_name)}{file_hash[:12]}"
+
+def find_complete_collection(collection_name: str, file_hash: str):
+    """Return the collection if a previous run fully ingested this exact file."""
+    if collection_name not in list_collection_names():
+        return None
+    collection = get_collection(collection_name)
+    metadata = collection.metadata or {}
+    if metadata.get("file_hash") == file_hash and metadata.get("complete"):
+        return collection
+    return None
 
 # ----------------- Store in ChromaDB (with batching) -----------------
-def store_chunks(chunks, collection_name: str):
-    collection = client.get_or_create_collection(
-        name=collection_name,
-        embedding_function=embed_func
-    )
+def _copy_existing_embeddings(collection, missing_ids, source_names, chunk_by_id):
+    """
+    Copy chunks that earlier versions of the same document already embedded.
+    Only the vectors are reused; page and chunk_index come from the new chunk in chunk_by_id.
+    """
+    copied = set()
+    for name in source_names:
+        if not missing_ids - copied:
+            break
+        found = get_collection(name).get(
+            ids=sorted(missing_ids - copied),
+            include=["documents", "embeddings"]
+        )
+        if not found["ids"]:
+            continue
+        metadatas = [chunk_by_id[cid][1] for cid in found["ids"]]
+        collection.add(
+            ids=found["ids"],
+            documents=found["documents"],
+            embeddings=found["embeddings"],
+            metadatas=metadatas if all(metadatas) else None
+        )
+        copied.update(found["ids"])
+    return copied
 
-    documents = []
-    ids = []
-    for i, chunk in enumerate(chunks):
-        documents.append(chunk)
-        ids.append(f"{collection_name}-{i}")
-    
-    collection.add(
-        documents=documents,
-        ids=ids
-    )
+def _new_chunk_records(collection, chunks, reuse_from, stats: dict, lexical_writer=None):
+    """
+    Yield records for chunks that are neither stored already nor reusable from reuse_from.
+    Every chunk not yet in the collection's BM25 index is handed to lexical_writer.
+    """
+    seen = set()
+    for batch in batched(chunks, write_batch_size()):
+        chunk_by_id = {}
+        for chunk in batch:
+            text, metadata = chunk if isinstance(chunk, tuple) else (chunk, None)
+            stats["total"] += 1
+            cid = chunk_id(text)
+            if cid not in seen:
+                seen.add(cid)
+                chunk_by_id[cid] = (text, metadata)
+        if not chunk_by_id:
+            continue
+
+        existing = set(collection.get(ids=list(chunk_by_id), include=[])["ids"])
+        missing = set(chunk_by_id) - existing
+        copied = _copy_existing_embeddings(collection, missing, reuse_from, chunk_by_id) if missing else set()
+        stats["existing"] += len(existing)
+        stats["reused"] += len(copied)
+
+        if lexical_writer is not None:
+            for cid, (text, _) in chunk_by_id.items():
+                if not lexical_writer.contains(cid):
+                    lexical_writer.add(cid, text)
+
+        for cid, (text, metadata) in chunk_by_id.items():
+            if cid in missing and cid not in copied:
+                yield {"id": cid, "document": text, "metadata": metadata}
+
+def store_chunks(chunks, collection_name: str, reuse_from=()):
+    """
+    Store chunks keyed by content hash, embedding only the ones not stored before.
+    chunks: iterable of strings or (text, metadata) tuples; consumed lazily.
+    reuse_from: names of collections (e.g. earlier versions of the same document)
+    whose embeddings are copied instead of recomputed.
+    """
+    collection = get_collection(collection_name)
+    stats = {"total": 0, "existing": 0, "reused": 0}
+    # The BM25 index is updated incrementally alongside the vectors
+    lexical_writer = lexical_index.IndexWriter(collection_name)
+    records = _new_chunk_records(collection, chunks, reuse_from, stats, lexical_writer)
+    embedded = embed_and_store(collection, records)
+    lexical_writer.flush()
+    print(f"[INFO] {stats['existing']} chunks already stored, {stats['reused']} reused, {embedded} embedded.")
+
+    return stats["total"]
 
 # ----------------- Reusable Ingest Function -----------------
-def ingest_file(file_path: str) -> str:
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".doc", ".txt", ".md", ".py", ".html", ".js", ".json", ".xml"}
+
+def store_document(chunks, source_name: str, file_hash: str) -> int:
+    """Store a document's chunks into its content-addressed collection and mark it complete."""
+    collection_name = collection_name_for(source_name, file_hash)
+    print(f"[INFO] Storing in ChromaDB collection: {collection_name}")
+    prefix = collection_prefix(source_name)
+    previous_versions = [name for name in list_collection_names()
+                         if name.startswith(prefix) and name != collection_name]
+    collection = get_collection(collection_name, metadata={"source": source_name, "file_hash": file_hash})
+    chunk_count = store_chunks(chunks, collection_name, reuse_from=previous_versions)
+    collection.modify(metadata={"source": source_name, "file_hash": file_hash, "complete": True})
+    return chunk_count
+
+def ingest_file(file_path: str, source_name: str = None) -> str:
+    """
+    Ingest a file into a collection named after its content hash.
+    Re-ingesting an unchanged file returns the existing collection without extracting or embedding.
+    source_name: original file name, when file_path is a temporary copy (e.g. a Streamlit upload).
+    """
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
 
-    print(f"[INFO] Extracting text from {file_path} ...")
-    raw_text = extract_text(file_path)
+    source_name = source_name or Path(file_path).name
+    file_hash = file_sha256(file_path)
+    collection_name = collection_name_for(source_name, file_hash)
+    if find_complete_collection(collection_name, file_hash):
+        print(f"[INFO] '{source_name}' is unchanged; reusing collection '{collection_name}'")
+        return collection_name
 
-    print(f"[INFO] Splitting text into chunks ...")
+    # Pages are extracted, split and embedded as a stream
+    print(f"[INFO] Extracting and splitting text from {file_path} ...")
     file_type = Path(file_path).suffix.lower()
-    chunks = split_text(raw_text, file_type)
-    print(f"[INFO] Created {len(chunks)} chunks.")
+    chunks = split_pages(extract_pages(file_path), file_type)
+    chunk_count = store_document(chunks, source_name, file_hash)
 
-    collection_name = f"doc_{Path(file_path).stem}_{uuid.uuid4().hex[:6]}"
-    print(f"[INFO] Storing in ChromaDB collection: {collection_name}")
+    print(f"[INFO] Ingested {chunk_count} chunks into collection '{collection_name}'")
+    return collection_name
 
-    store_chunks(chunks, collection_name)
+# ----------------- Bulk Ingestion -----------------
+def expand_paths(patterns):
+    """Expand files, directories (recursively) and glob patterns into supported file paths."""
+    files = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) or [pattern]
+        for match in matches:
+            path = Path(match)
+            if path.is_dir():
+                files.extend(p for p in sorted(path.rglob("*")) if p.is_file())
+            elif path.is_file():
+                files.append(path)
+            else:
+                print(f"[WARN] No such file or directory: {match}")
+    seen = set()
+    unique = []
+    for path in files:
+        if path.suffix.lower() in SUPPORTED_EXTENSIONS and path.resolve() not in seen:
+            seen.add(path.resolve())
+            unique.append(str(path))
+    return unique
 
-    print(f"[INFO] Ingested {len(chunks)} chunks into collection '{collection_name}'")
-    return collection_name
+def _extract_and_split(file_path: str, spool_path: str) -> str:
+    """
+    Process-pool worker: CPU-bound extraction and splitting, no model or vectorstore access.
+    Chunks are streamed to a JSON-lines spool file rather than returned, so neither the
+    worker nor the parent ever holds a whole document.
+    """
+    file_type = Path(file_path).suffix.lower()
+    with open(spool_path, "w", encoding="utf-8") as f:
+        for chunk, metadata in split_pages(extract_pages(file_path), file_type):
+            f.write(json.dumps([chunk, metadata]) + "\n")
+    return spool_path
+
+def _read_spool(spool_path: str):
+    """Yield (chunk, metadata) pairs back from a spool file one line at a time, then delete it."""
+    try:
+        with open(spool_path, "r", encoding="utf-8") as f:
+            for line in f:
+                chunk, metadata = json.loads(line)
+                yield chunk, metadata
+    finally:
+        os.remove(spool_path)
+
+def _load_manifest(manifest_path: str) -> dict:
+    if not manifest_path or not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _save_manifest(manifest_path: str, manifest: dict):
+    if not manifest_path:
+        return
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def ingest_paths(patterns, workers: int = None, manifest_path: str = None) -> dict:
+    """
+    Ingest many files: extraction and splitting run in a process pool while this process
+    runs the single shared embedding stage. Interrupted runs resume where they stopped:
+    completed files are skipped by content hash and partially stored files only embed
+    their missing chunks. manifest_path records path -> collection for every finished file.
+    """
+    files = expand_paths(patterns)
+    manifest = _load_manifest(manifest_path)
+    stats = {"files": 0, "skipped": 0, "failed": 0, "chunks": 0}
+    start = time.perf_counter()
+
+    # Hashing is cheap I/O; only files without a complete collection go to the pool
+    jobs = []
+    for file_path in files:
+        file_hash = file_sha256(file_path)
+        collection_name = collection_name_for(Path(file_path).name, file_hash)
+        if find_complete_collection(collection_name, file_hash):
+            manifest[file_path] = collection_name
+            stats["skipped"] += 1
+        else:
+            jobs.append((file_path, file_hash))
+    print(f"[INFO] {len(files)} files found, {stats['skipped']} already ingested, {len(jobs)} to ingest.")
+
+    workers = workers or os.cpu_count() or 1
+    # Workers spool their chunks to disk; the parent streams each file from there in write batches
+    spool_dir = tempfile.mkdtemp(prefix="devbot_ingest_")
+
+    def submit(pool, index: int, path: str):
+        return pool.submit(_extract_and_split, path, os.path.join(spool_dir, f"{index}.jsonl"))
+
+    try:
+        # spawn keeps workers from inheriting the embedding model and its thread pools
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            pending = deque()
+            job_iter = enumerate(jobs)
+            for index, (file_path, file_hash) in islice(job_iter, workers * 2):
+                pending.append((file_path, file_hash, submit(pool, index, file_path)))
+
+            while pending:
+                file_path, file_hash, future = pending.popleft()
+                for index, (next_path, next_hash) in islice(job_iter, 1):
+                    pending.append((next_path, next_hash, submit(pool, index, next_path)))
+                try:
+                    chunks = _read_spool(future.result())
+                    stats["chunks"] += store_document(chunks, Path(file_path).name, file_hash)
+                    manifest[file_path] = collection_name_for(Path(file_path).name, file_hash)
+                    _save_manifest(manifest_path, manifest)
+                    stats["files"] += 1
+                except Exception as e:
+                    print(f"[ERROR] Failed to ingest {file_path}: {e}")
+                    stats["failed"] += 1
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    _save_manifest(manifest_path, manifest)
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = elapsed
+    print(
+        f"[INFO] Ingested {stats['files']} files ({stats['skipped']} skipped, {stats['failed']} failed), "
+        f"{stats['chunks']} chunks in {elapsed:.1f}s: "
+        f"{stats['files'] / elapsed if elapsed else 0:.2f} files/s, "
+        f"{stats['chunks'] / elapsed if elapsed else 0:.1f} chunks/s"
+    )
+    return stats
 
 # ----------------- CLI Support -----------------
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python ingest_document.py <path-to-document>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Ingest documents into the DevBot vectorstore.")
+    parser.add_argument("paths", nargs="+", help="Files, directories or glob patterns to ingest")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes used for extraction and splitting (default: CPU count)")
+    parser.add_argument("--manifest", default=None,
+                        help="JSON file recording the collection created for each file")
+    args = parser.parse_args()
 
-    file_path = sys.argv[1]
-    ingest_file(file_path)
+    if len(args.paths) == 1 and os.path.isfile(args.paths[0]) and args.workers is None and not args.manifest:
+        ingest_file(args.paths[0])
+    else:
+        ingest_paths(args.paths, workers=args.workers, manifest_path=args.manifest)
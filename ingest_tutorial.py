@@ -1,57 +1,40 @@
-import fitz
 import os
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-# Import shared objects from the config file
-from config import client, embed_func
-from pathlib import Path
+import uuid
+# Shared, lazily loaded model and ChromaDB client
+from registry import get_collection, delete_collection, swap_alias
+from embedding_pipeline import embed_and_store
+from ingest_document import extract_pages, split_pages
 
 # ----------------- Config -----------------
 PDF_PATH = "tutorials/pythonlearn.pdf"
 COLLECTION_NAME = "python_tutorial"
 
-# ----------------- PDF Extraction -----------------
-def extract_text_from_pdf(path):
-    text = ""
-    doc = fitz.open(path)
-    for page in doc:
-        text += page.get_text()
-    return text
-
-# ----------------- Text Splitting -----------------
-def split_text(text):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=100,
-        separators=["\n\n", "\n", ".", " ", ""]
-    )
-    return splitter.split_text(text)
+# ----------------- PDF Extraction and Splitting -----------------
+def iter_tutorial_chunks(path):
+    """Stream (chunk, metadata) pairs page by page; metadata carries the page number."""
+    return split_pages(extract_pages(path), ".pdf")
 
 # ----------------- Store Chunks (with batching) -----------------
-def store_chunks(chunks):
-    collection = client.get_or_create_collection(
-        name=COLLECTION_NAME,
-        embedding_function=embed_func
-    )
-
-    documents = []
-    ids = []
-    for i, chunk in enumerate(chunks):
-        documents.append(chunk)
-        ids.append(f"{COLLECTION_NAME}-{i}")
+def store_chunks(chunks) -> int:
+    # Built on the side and swapped in, so readers (and cached answers) see the change at once
+    side_name = f"{COLLECTION_NAME}__{uuid.uuid4().hex[:12]}"
+    collection = get_collection(side_name)
 
-    collection.add(
-        documents=documents,
-        ids=ids
+    records = (
+        {"id": f"{COLLECTION_NAME}-{i}", "document": chunk, "metadata": metadata}
+        for i, (chunk, metadata) in enumerate(chunks)
     )
+    count = embed_and_store(collection, records)
+    previous = swap_alias(COLLECTION_NAME, side_name)
+    delete_collection(previous, follow_alias=False)
+    return count
 
 # ----------------- CLI -----------------
 if __name__ == "__main__":
     assert os.path.exists(PDF_PATH), f"PDF not found at {PDF_PATH}"
     print(f"Attempting to ingest tutorial from {PDF_PATH}...")
     try:
-        raw_text = extract_text_from_pdf(PDF_PATH)
-        chunks = split_text(raw_text)
-        store_chunks(chunks)
-        print(f"Ingested {len(chunks)} chunks into collection '{COLLECTION_NAME}' successfully.")
+        chunk_count = store_chunks(iter_tutorial_chunks(PDF_PATH))
+        print(f"Ingested {chunk_count} chunks into collection '{COLLECTION_NAME}' successfully.")
     except Exception as e:
         print(f"Failed to ingest tutorial: {e}")
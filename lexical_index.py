@@ -0,0 +1,250 @@
+# lexical_index.py
+import os
+import re
+import json
+import math
+import shutil
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+from config import VECTORSTORE_PATH, BM25_K1, BM25_B, LEXICAL_SEGMENT_DOCS, LEXICAL_MAX_SEGMENTS
+
+# ----------------- BM25 Inverted Index -----------------
+# Each Chroma collection gets a sibling index under <vectorstore>/lexical/<collection>/.
+# The index is a list of immutable segments; each segment stores its postings as flat
+# .npy arrays (offsets / doc numbers / term frequencies) that are memory-mapped at query
+# time, so an idle index costs almost no RAM and a query only touches the terms it asks for.
+LEXICAL_ROOT = os.path.join(VECTORSTORE_PATH, "lexical")
+
+_TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+def tokenize(text: str):
+    """
+    Identifier-aware tokens: the whole identifier (read_csv, ValueError, E1101) plus its
+    snake_case / camelCase parts, so both exact names and their words match.
+    """
+    tokens = []
+    for match in _TOKEN_RE.findall(text):
+        tokens.append(match.lower())
+        parts = [p for piece in match.split("_") for p in _CAMEL_RE.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+def index_dir(collection_name: str) -> str:
+    return os.path.join(LEXICAL_ROOT, collection_name)
+
+# ----------------- Segments -----------------
+def _write_segment(path: str, doc_ids, postings, doc_lengths):
+    """postings: {term: [(doc_number, tf), ...]} with doc numbers local to the segment."""
+    os.makedirs(path, exist_ok=True)
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    for i, term in enumerate(terms):
+        offsets[i + 1] = offsets[i] + len(postings[term])
+    docs = np.empty(int(offsets[-1]), dtype=np.int32)
+    tfs = np.empty(int(offsets[-1]), dtype=np.uint16)
+    for i, term in enumerate(terms):
+        entries = postings[term]
+        docs[offsets[i]:offsets[i + 1]] = [doc for doc, _ in entries]
+        tfs[offsets[i]:offsets[i + 1]] = [min(tf, 65535) for _, tf in entries]
+
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+    np.save(os.path.join(path, "docs.npy"), docs)
+    np.save(os.path.join(path, "tfs.npy"), tfs)
+    np.save(os.path.join(path, "doc_lengths.npy"), np.asarray(doc_lengths, dtype=np.int32))
+    with open(os.path.join(path, "terms.json"), "w", encoding="utf-8") as f:
+        json.dump(terms, f)
+    with open(os.path.join(path, "doc_ids.json"), "w", encoding="utf-8") as f:
+        json.dump(list(doc_ids), f)
+
+class _Segment:
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "terms.json"), "r", encoding="utf-8") as f:
+            self.term_index = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(path, "doc_ids.json"), "r", encoding="utf-8") as f:
+            self.doc_ids = json.load(f)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.docs = np.load(os.path.join(path, "docs.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, "tfs.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"), mmap_mode="r")
+
+    def postings(self, term: str):
+        i = self.term_index.get(term)
+        if i is None:
+            return None, None
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.docs[start:end], self.tfs[start:end]
+
+    def iter_postings(self):
+        for term, i in self.term_index.items():
+            start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+            yield term, self.docs[start:end], self.tfs[start:end]
+
+# ----------------- Index -----------------
+class LexicalIndex:
+    """Segmented BM25 index for one collection; segments are append-only and merged when too many pile up."""
+
+    def __init__(self, collection_name: str):
+        self.collection_name = collection_name
+        self.path = index_dir(collection_name)
+        self.segments = []
+        self.indexed_ids = set()
+        self._manifest_mtime = None
+        self.reload()
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, "manifest.json")
+
+    def reload(self):
+        manifest_path = self._manifest_path()
+        if not os.path.exists(manifest_path):
+            self.segments, self.indexed_ids, self._manifest_mtime = [], set(), None
+            return
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.segments = [_Segment(os.path.join(self.path, name)) for name in manifest["segments"]]
+        self.indexed_ids = {doc_id for segment in self.segments for doc_id in segment.doc_ids}
+        self._manifest_mtime = os.path.getmtime(manifest_path)
+
+    def is_stale(self) -> bool:
+        manifest_path = self._manifest_path()
+        mtime = os.path.getmtime(manifest_path) if os.path.exists(manifest_path) else None
+        return mtime != self._manifest_mtime
+
+    def _save_manifest(self, segment_names):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{self._manifest_path()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"segments": segment_names}, f)
+        os.replace(tmp_path, self._manifest_path())
+
+    def _next_segment_name(self) -> str:
+        existing = [int(name.split("_")[1]) for name in os.listdir(self.path) if name.startswith("seg_")] \
+            if os.path.isdir(self.path) else []
+        return f"seg_{max(existing, default=0) + 1:06d}"
+
+    # ---------- Writing ----------
+    def add_segment(self, doc_ids, texts):
+        """Index a batch of new documents as one segment; already indexed IDs are skipped."""
+        postings = defaultdict(list)
+        new_ids, doc_lengths = [], []
+        for doc_id, text in zip(doc_ids, texts):
+            if doc_id in self.indexed_ids:
+                continue
+            counts = Counter(tokenize(text))
+            doc_number = len(new_ids)
+            for term, tf in counts.items():
+                postings[term].append((doc_number, tf))
+            new_ids.append(doc_id)
+            doc_lengths.append(sum(counts.values()))
+        if not new_ids:
+            return 0
+
+        name = self._next_segment_name()
+        _write_segment(os.path.join(self.path, name), new_ids, postings, doc_lengths)
+        self._save_manifest([os.path.basename(s.path) for s in self.segments] + [name])
+        self.reload()
+        if len(self.segments) > LEXICAL_MAX_SEGMENTS:
+            self.merge_segments()
+        return len(new_ids)
+
+    def merge_segments(self):
+        """Merge every segment into one so queries touch a single set of arrays."""
+        if len(self.segments) < 2:
+            return
+        postings = defaultdict(list)
+        doc_ids, doc_lengths = [], []
+        for segment in self.segments:
+            base = len(doc_ids)
+            for term, docs, tfs in segment.iter_postings():
+                postings[term].extend(zip((int(d) + base for d in docs), (int(t) for t in tfs)))
+            doc_ids.extend(segment.doc_ids)
+            doc_lengths.extend(int(n) for n in segment.doc_lengths)
+
+        old_paths = [segment.path for segment in self.segments]
+        name = self._next_segment_name()
+        _write_segment(os.path.join(self.path, name), doc_ids, postings, doc_lengths)
+        self._save_manifest([name])
+        self.reload()
+        for path in old_paths:
+            shutil.rmtree(path, ignore_errors=True)
+
+    # ---------- Querying ----------
+    def search(self, query: str, top_k: int = 5, k1: float = BM25_K1, b: float = BM25_B):
+        """Return [(doc_id, bm25_score)] best first."""
+        if not self.segments:
+            return []
+        terms = set(tokenize(query))
+        total_docs = sum(len(segment.doc_ids) for segment in self.segments)
+        avg_length = sum(float(segment.doc_lengths.sum()) for segment in self.segments) / max(total_docs, 1)
+
+        scores = {}
+        for term in terms:
+            per_segment = [(segment, *segment.postings(term)) for segment in self.segments]
+            df = sum(len(docs) for _, docs, _ in per_segment if docs is not None)
+            if not df:
+                continue
+            idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+            for segment, docs, tfs in per_segment:
+                if docs is None:
+                    continue
+                tf = np.asarray(tfs, dtype=np.float32)
+                lengths = np.asarray(segment.doc_lengths[docs], dtype=np.float32)
+                partial = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths / avg_length))
+                for doc, score in zip(docs.tolist(), partial.tolist()):
+                    doc_id = segment.doc_ids[doc]
+                    scores[doc_id] = scores.get(doc_id, 0.0) + score
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+# ----------------- Shared Handles -----------------
+_indexes = {}
+_lock = threading.Lock()
+
+def get_index(collection_name: str) -> LexicalIndex:
+    """Cached index handle; reloaded when another process has written new segments."""
+    with _lock:
+        index = _indexes.get(collection_name)
+        if index is None:
+            index = _indexes[collection_name] = LexicalIndex(collection_name)
+        elif index.is_stale():
+            index.reload()
+        return index
+
+def has_index(collection_name: str) -> bool:
+    return os.path.exists(os.path.join(index_dir(collection_name), "manifest.json"))
+
+def search(collection_name: str, query: str, top_k: int = 5):
+    if not has_index(collection_name):
+        return []
+    return get_index(collection_name).search(query, top_k)
+
+def delete_index(collection_name: str):
+    with _lock:
+        _indexes.pop(collection_name, None)
+    shutil.rmtree(index_dir(collection_name), ignore_errors=True)
+
+class IndexWriter:
+    """Buffers documents during ingestion and writes a segment every LEXICAL_SEGMENT_DOCS documents."""
+
+    def __init__(self, collection_name: str):
+        self.index = get_index(collection_name)
+        self._ids, self._texts = [], []
+
+    def contains(self, doc_id: str) -> bool:
+        return doc_id in self.index.indexed_ids
+
+    def add(self, doc_id: str, text: str):
+        self._ids.append(doc_id)
+        self._texts.append(text)
+        if len(self._ids) >= LEXICAL_SEGMENT_DOCS:
+            self.flush()
+
+    def flush(self):
+        if self._ids:
+            with _lock:
+                self.index.add_segment(self._ids, self._texts)
+            self._ids, self._texts = [], []
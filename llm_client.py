@@ -0,0 +1,257 @@
+# llm_client.py
+import json
+import threading
+import time
+import weakref
+import asyncio
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    LLM_ENDPOINT, LLM_MODEL, LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT,
+    LLM_POOL_SIZE, LLM_HEALTH_TTL, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_KEEP_ALIVE,
+)
+
+# ----------------- Errors -----------------
+class LLMError(Exception):
+    """Base error for LLM client failures."""
+
+class LLMUnavailableError(LLMError):
+    """Raised without touching the network while the endpoint is backing off."""
+
+class LLMResponseError(LLMError):
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"[LLM Error {status_code}] {text}")
+        self.status_code = status_code
+        self.text = text
+
+# ----------------- Endpoint State -----------------
+class _EndpointState:
+    """
+    Health and backoff tracking used by both the sync and async clients.
+    Health is tracked from real requests: after a failure the endpoint is skipped for an
+    exponentially growing backoff window instead of probing it before every question.
+    """
+
+    def __init__(self, endpoint: str, model: str):
+        self.endpoint = endpoint
+        self.base_url = endpoint.rsplit("/api/", 1)[0]
+        self.model = model
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._retry_at = 0.0
+        self._healthy = None
+        self._health_checked_at = 0.0
+
+    # ---------- Health / backoff ----------
+    def _record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._retry_at = 0.0
+            self._healthy = True
+            self._health_checked_at = time.monotonic()
+
+    def _record_failure(self):
+        with self._lock:
+            self._failures += 1
+            delay = min(LLM_BACKOFF_BASE * (2 ** (self._failures - 1)), LLM_BACKOFF_MAX)
+            self._retry_at = time.monotonic() + delay
+            self._healthy = False
+            self._health_checked_at = time.monotonic()
+
+    def _check_backoff(self):
+        with self._lock:
+            remaining = self._retry_at - time.monotonic()
+        if remaining > 0:
+            raise LLMUnavailableError(
+                f"LLM endpoint {self.base_url} failed recently; retrying in {remaining:.1f}s"
+            )
+
+    def health(self) -> dict:
+        with self._lock:
+            return {
+                "healthy": self._healthy,
+                "consecutive_failures": self._failures,
+                "retry_in": max(0.0, self._retry_at - time.monotonic()),
+            }
+
+# ----------------- Client -----------------
+class OllamaClient(_EndpointState):
+    """Pooled, keep-alive client for the Ollama generate API."""
+
+    def __init__(self, endpoint: str = LLM_ENDPOINT, model: str = LLM_MODEL,
+                 connect_timeout: float = LLM_CONNECT_TIMEOUT, read_timeout: float = LLM_READ_TIMEOUT,
+                 pool_size: int = LLM_POOL_SIZE):
+        super().__init__(endpoint, model)
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def is_healthy(self, force: bool = False) -> bool:
+        """Cached reachability of the endpoint; only probes when the cached state is stale."""
+        with self._lock:
+            fresh = time.monotonic() - self._health_checked_at < LLM_HEALTH_TTL
+            if self._healthy is not None and fresh and not force:
+                return self._healthy
+        try:
+            self.session.get(self.base_url, timeout=self.timeout).raise_for_status()
+        except requests.exceptions.RequestException:
+            self._record_failure()
+            return False
+        self._record_success()
+        return True
+
+    # ---------- Generation ----------
+    def _post(self, prompt: str, model: str, stream: bool):
+        self._check_backoff()
+        payload = {"model": model or self.model, "prompt": prompt, "stream": stream}
+        try:
+            response = self.session.post(self.endpoint, data=json.dumps(payload), timeout=self.timeout, stream=stream)
+        except requests.exceptions.RequestException:
+            self._record_failure()
+            raise
+        if response.status_code != 200:
+            if response.status_code >= 500:
+                self._record_failure()
+            error = LLMResponseError(response.status_code, response.text)
+            response.close()
+            raise error
+        return response
+
+    def generate(self, prompt: str, model: str = None) -> str:
+        """Blocking generation; returns the full response text."""
+        response = self._post(prompt, model, stream=False)
+        try:
+            text = response.json().get("response", "")
+        finally:
+            response.close()
+        self._record_success()
+        return text
+
+    def generate_stream(self, prompt: str, model: str = None):
+        """Yield tokens from Ollama's NDJSON stream as they are generated."""
+        response = self._post(prompt, model, stream=True)
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise LLMError(f"[LLM Error] {chunk['error']}")
+                token = chunk.get("response", "")
+                if token:
+                    yield token
+                if chunk.get("done"):
+                    break
+        except requests.exceptions.RequestException:
+            self._record_failure()
+            raise
+        finally:
+            response.close()
+        self._record_success()
+
+# ----------------- Async Client -----------------
+class AsyncOllamaClient(_EndpointState):
+    """
+    httpx-based async counterpart of OllamaClient. An httpx.AsyncClient is bound to the
+    event loop it was created on, so one pooled client is kept per running loop.
+    Leaving a generate_stream early (e.g. the task was cancelled) closes the connection,
+    which makes Ollama stop generating.
+    """
+
+    def __init__(self, endpoint: str = LLM_ENDPOINT, model: str = LLM_MODEL,
+                 connect_timeout: float = LLM_CONNECT_TIMEOUT, read_timeout: float = LLM_READ_TIMEOUT,
+                 pool_size: int = LLM_POOL_SIZE):
+        super().__init__(endpoint, model)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self._clients = weakref.WeakKeyDictionary()
+        self._warmed_at = {}
+        self._warming = set()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return client
+
+    async def warm(self, model: str = None):
+        """
+        Load the model into Ollama's memory (a request without a prompt) so the real
+        generation does not pay for it; skipped while it should still be resident, or
+        while another warm-up of it is in flight, so a cold burst loads the model once.
+        """
+        model = model or self.model
+        if model in self._warming or time.monotonic() - self._warmed_at.get(model, float("-inf")) < LLM_KEEP_ALIVE:
+            return
+        self._check_backoff()
+        self._warming.add(model)
+        try:
+            response = await self._client().post(self.endpoint, json={"model": model})
+        except httpx.TransportError:
+            self._record_failure()
+            raise
+        finally:
+            self._warming.discard(model)
+        if response.status_code == 200:
+            self._warmed_at[model] = time.monotonic()
+
+    async def generate_stream(self, prompt: str, model: str = None):
+        """Async-iterate tokens from Ollama's NDJSON stream as they are generated."""
+        self._check_backoff()
+        model = model or self.model
+        payload = {"model": model, "prompt": prompt, "stream": True}
+        try:
+            async with self._client().stream("POST", self.endpoint, json=payload) as response:
+                if response.status_code != 200:
+                    if response.status_code >= 500:
+                        self._record_failure()
+                    text = (await response.aread()).decode("utf-8", errors="replace")
+                    raise LLMResponseError(response.status_code, text)
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise LLMError(f"[LLM Error] {chunk['error']}")
+                    token = chunk.get("response", "")
+                    if token:
+                        yield token
+                    if chunk.get("done"):
+                        break
+        except httpx.TransportError:
+            self._record_failure()
+            raise
+        self._record_success()
+        self._warmed_at[model] = time.monotonic()
+
+    async def generate(self, prompt: str, model: str = None) -> str:
+        return "".join([token async for token in self.generate_stream(prompt, model)])
+
+# ----------------- Shared Instance -----------------
+_client = None
+_client_lock = threading.Lock()
+
+def get_llm_client() -> OllamaClient:
+    """Process-wide client so every caller shares one connection pool and health state."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OllamaClient()
+    return _client
+
+_async_client = None
+
+def get_async_llm_client() -> AsyncOllamaClient:
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncOllamaClient()
+    return _async_client
@@ -0,0 +1,241 @@
+# llm_scheduler.py
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+from config import LLM_MAX_CONCURRENT, LLM_MAX_QUEUE, LLM_MAX_QUEUED_PER_USER, LLM_QUEUE_TIMEOUT
+from llm_client import LLMError
+
+# ----------------- Errors -----------------
+class LLMBusyError(LLMError):
+    """Raised instead of queueing when the LLM queue is full, or when a queued request waited too long."""
+
+    def __init__(self, message: str):
+        super().__init__(f"[LLM Busy] {message}")
+
+# ----------------- Scheduler -----------------
+class Ticket:
+    """One request's place in the LLM queue; granted when it may start generating."""
+
+    def __init__(self, scheduler, user: str):
+        self.scheduler = scheduler
+        self.user = user
+        self.enqueued_at = time.monotonic()
+        self.granted = threading.Event()
+        self.done = False
+        self._on_grant = None
+
+    def position(self) -> int:
+        """1-based place in line; 0 once the request is generating."""
+        return self.scheduler.position(self)
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.granted.wait(timeout)
+
+    def on_grant(self, callback):
+        """Call callback() once the ticket is granted, right away if it already is."""
+        with self.scheduler._lock:
+            if not self.granted.is_set():
+                self._on_grant = callback
+                return
+        callback()
+
+    def _grant(self):
+        # Runs under the scheduler lock, so callbacks must only hand off (e.g. call_soon_threadsafe)
+        self.granted.set()
+        if self._on_grant:
+            self._on_grant()
+
+    def release(self):
+        self.scheduler.release(self)
+
+class LLMScheduler:
+    """
+    Admission control in front of the local LLM.
+    At most max_concurrent generations run at once; waiting requests are served round-robin
+    across users, so one user's burst cannot starve everyone else. New requests are rejected
+    immediately (LLMBusyError) once max_queue requests, or max_per_user for one user, are waiting.
+    """
+
+    def __init__(self, max_concurrent: int = LLM_MAX_CONCURRENT, max_queue: int = LLM_MAX_QUEUE,
+                 max_per_user: int = LLM_MAX_QUEUED_PER_USER):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self._lock = threading.Lock()
+        self._queues = OrderedDict()   # user -> deque of waiting tickets, in round-robin order
+        self._waiting = 0
+        self._active = set()
+        self._waits = deque(maxlen=500)
+        self._stats = {"admitted": 0, "rejected": 0, "cancelled": 0, "timed_out": 0, "max_depth": 0}
+
+    # ---------- Queue ----------
+    def submit(self, user: str = None) -> Ticket:
+        """Queue a request for user; raises LLMBusyError instead of queueing past the limits."""
+        user = user or "anonymous"
+        with self._lock:
+            rejection = self._rejection(user)
+            if rejection:
+                self._stats["rejected"] += 1
+                raise LLMBusyError(rejection)
+            ticket = Ticket(self, user)
+            self._queues.setdefault(user, deque()).append(ticket)
+            self._waiting += 1
+            self._stats["max_depth"] = max(self._stats["max_depth"], self._waiting)
+            self._dispatch()
+        return ticket
+
+    def _rejection(self, user: str):
+        if self._waiting >= self.max_queue:
+            return f"{self._waiting} requests are already waiting; please retry shortly."
+        if len(self._queues.get(user, ())) >= self.max_per_user:
+            return "You already have requests waiting; please wait for them to finish."
+        return None
+
+    def would_admit(self, user: str = None) -> bool:
+        """Whether submit(user) would queue a request right now instead of rejecting it."""
+        with self._lock:
+            return self._rejection(user or "anonymous") is None
+
+    def _dispatch(self):
+        while len(self._active) < self.max_concurrent and self._queues:
+            user, tickets = next(iter(self._queues.items()))
+            ticket = tickets.popleft()
+            # The user goes to the back of the rotation, or leaves it when nothing else is waiting
+            del self._queues[user]
+            if tickets:
+                self._queues[user] = tickets
+            self._waiting -= 1
+            self._active.add(ticket)
+            self._waits.append(time.monotonic() - ticket.enqueued_at)
+            self._stats["admitted"] += 1
+            ticket._grant()
+
+    def position(self, ticket: Ticket) -> int:
+        with self._lock:
+            if ticket in self._active or ticket.done:
+                return 0
+            users = list(self._queues)
+            if ticket.user not in self._queues or ticket not in self._queues[ticket.user]:
+                return 0
+            index = self._queues[ticket.user].index(ticket)
+            rotation = users.index(ticket.user)
+            # Round-robin serves every user's k-th request before anyone's (k+1)-th
+            ahead = sum(min(len(self._queues[user]), index) for user in users)
+            ahead += sum(1 for user in users[:rotation] if len(self._queues[user]) > index)
+            return ahead + 1
+
+    def release(self, ticket: Ticket):
+        """Finish a granted request, or withdraw one that is still waiting."""
+        with self._lock:
+            if ticket.done:
+                return
+            ticket.done = True
+            if ticket in self._active:
+                self._active.discard(ticket)
+            else:
+                tickets = self._queues.get(ticket.user)
+                if tickets and ticket in tickets:
+                    tickets.remove(ticket)
+                    if not tickets:
+                        del self._queues[ticket.user]
+                    self._waiting -= 1
+                    self._stats["cancelled"] += 1
+            self._dispatch()
+
+    # ---------- Slots ----------
+    def _wait_for_turn(self, ticket: Ticket, on_queue=None, timeout: float = LLM_QUEUE_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while not ticket.wait(0.5):
+            if on_queue:
+                on_queue(ticket.position())
+            if time.monotonic() >= deadline:
+                with self._lock:
+                    self._stats["timed_out"] += 1
+                ticket.release()
+                raise LLMBusyError(f"No generation slot within {timeout:.0f}s; please retry shortly.")
+
+    async def _await_turn(self, ticket: Ticket, on_queue=None, timeout: float = LLM_QUEUE_TIMEOUT):
+        # Waits on the event loop itself, so queued requests hold no executor threads
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def resolve():
+            if not granted.done():
+                granted.set_result(None)
+
+        ticket.on_grant(lambda: loop.call_soon_threadsafe(resolve))
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                with self._lock:
+                    self._stats["timed_out"] += 1
+                ticket.release()
+                raise LLMBusyError(f"No generation slot within {timeout:.0f}s; please retry shortly.")
+            done, _ = await asyncio.wait({granted}, timeout=min(0.5, remaining))
+            if done:
+                return
+            if on_queue:
+                on_queue(ticket.position())
+
+    @contextmanager
+    def slot(self, user: str = None, on_queue=None, timeout: float = LLM_QUEUE_TIMEOUT):
+        """
+        Hold a generation slot for the duration of the block.
+        on_queue(position) is called while waiting and with 0 once the slot is granted.
+        """
+        ticket = self.submit(user)
+        try:
+            if not ticket.granted.is_set():
+                if on_queue:
+                    on_queue(ticket.position())
+                self._wait_for_turn(ticket, on_queue, timeout)
+            if on_queue:
+                on_queue(0)
+            yield ticket
+        finally:
+            ticket.release()
+
+    @asynccontextmanager
+    async def aslot(self, user: str = None, on_queue=None, timeout: float = LLM_QUEUE_TIMEOUT):
+        """Async slot(); cancelling the waiting task withdraws its request from the queue."""
+        ticket = self.submit(user)
+        try:
+            if not ticket.granted.is_set():
+                if on_queue:
+                    on_queue(ticket.position())
+                await self._await_turn(ticket, on_queue, timeout)
+            if on_queue:
+                on_queue(0)
+            yield ticket
+        finally:
+            ticket.release()
+
+    # ---------- Metrics ----------
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            return dict(
+                self._stats,
+                active=len(self._active),
+                queued=self._waiting,
+                queued_users=len(self._queues),
+                max_concurrent=self.max_concurrent,
+                wait_avg_s=sum(waits) / len(waits) if waits else 0.0,
+                wait_p95_s=waits[int(len(waits) * 0.95) - 1] if waits else 0.0,
+            )
+
+# ----------------- Shared Instance -----------------
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> LLMScheduler:
+    """Process-wide scheduler; every Streamlit session in this process shares its slots."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
@@ -1,31 +1,43 @@
 # memory_logger.py
-import os
-from chromadb import PersistentClient
-from chromadb.utils import embedding_functions
-
-# ----------------- Config -----------------
-MEMORY_DB_PATH = "./vectorstore" # Use consistent path
-MEMORY_COLLECTION = "user_memory"
-EMBED_MODEL_PATH = "./models/all-MiniLM-L6-v2" # Use consistent path
+import re
+import sys
+import time
+import uuid
+import hashlib
+from collections import defaultdict
+import numpy as np
+from config import (
+    MEMORY_COLLECTION, MEMORY_NEAR_DUP_DISTANCE, MEMORY_MAX_ENTRIES_PER_USER,
+    MEMORY_EVICTION_POLICY, MEMORY_COMPACTION_DISTANCE,
+)
+from registry import get_collection, list_collection_names, list_aliases, delete_collection, swap_alias
+from embedding_cache import get_embedding_cache
 
 # ----------------- Setup ChromaDB -----------------
-try:
-    embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBED_MODEL_PATH)
-    client = PersistentClient(path=MEMORY_DB_PATH)
-    collection = client.get_or_create_collection(name=MEMORY_COLLECTION, embedding_function=embedding_func)
-except Exception as e:
-    print(f"[Memory Logger Error] Failed to initialize ChromaDB: {e}")
-    # Fallback or exit if this is critical
-    collection = None
+def memory_collection_name(user_email: str = None) -> str:
+    """Each user gets their own memory partition; no user means the shared legacy collection."""
+    if not user_email:
+        return MEMORY_COLLECTION
+    return f"{MEMORY_COLLECTION}_{hashlib.sha256(user_email.strip().lower().encode()).hexdigest()[:16]}"
+
+def get_memory_collection(user_email: str = None):
+    """Memory collection handle for a user, or None if the vectorstore is unavailable."""
+    try:
+        return get_collection(memory_collection_name(user_email))
+    except Exception as e:
+        print(f"[Memory Logger Error] Failed to initialize ChromaDB: {e}")
+        return None
 
 # ----------------- Memory Logging -----------------
 def log_memory(question: str, answer: str, tag: str = "chat"):
     """Add a Q&A pair to memory if not empty."""
+    collection = get_memory_collection()
     if not collection or not question.strip() or not answer.strip():
         return
 
     combined = f"Q: {question.strip()}\nA: {answer.strip()}"
-    uid = f"memory_{hash(combined)}"
+    # Deterministic across processes, unlike the salted built-in hash()
+    uid = f"memory_{content_hash(combined)}"
 
     # Check if the document already exists based on ID
     if collection.get(ids=[uid]).get("documents"):
@@ -40,8 +52,208 @@ def log_memory(question: str, answer: str, tag: str = "chat"):
     except Exception as e:
         print(f"[Memory Logger Error] Failed to add to collection: {e}")
 
+# ----------------- Content Hashing -----------------
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+def question_hash(question: str) -> str:
+    return content_hash(normalize_text(question))
+
+def memory_id(question: str, answer: str) -> str:
+    """Deterministic ID for a Q&A pair, so an exact repeat is a primary-key lookup."""
+    return f"mem_{content_hash(normalize_text(question) + chr(31) + answer.strip())}"
+
+def find_by_question(question: str, user_email: str = None):
+    """Memory entries for a question, looked up through the indexed q_hash metadata field."""
+    collection = get_memory_collection(user_email)
+    if not collection:
+        return []
+    found = collection.get(where={"q_hash": question_hash(question)})
+    return [
+        {"id": doc_id, "question": doc, "answer": (metadata or {}).get("answer")}
+        for doc_id, doc, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+    ]
+
+def _near_duplicates(collection, embeddings, max_distance: float):
+    """Indexes of embeddings whose nearest stored memory lies within max_distance (cosine)."""
+    if not max_distance or not collection.count():
+        return set()
+    results = collection.query(query_embeddings=embeddings, n_results=1, include=["distances"])
+    # Chroma's default space is squared L2; for unit vectors that equals 2 * cosine distance
+    return {
+        i for i, distances in enumerate(results.get("distances") or [])
+        if distances and distances[0] <= 2 * max_distance
+    }
+
+# ----------------- Chat Memory -----------------
+def log_qa_pairs(entries, near_dup_distance: float = MEMORY_NEAR_DUP_DISTANCE):
+    """
+    Store chat Q&A pairs (question as the document, answer in metadata) in one batch per user.
+    entries: iterable of {"question", "answer", optional "embedding", optional "user_email"} dicts.
+    Exact repeats are skipped by their deterministic ID; when near_dup_distance is set,
+    paraphrased repeats closer than that cosine distance to a stored question are skipped too.
+    """
+    by_user = defaultdict(list)
+    for entry in entries:
+        by_user[entry.get("user_email")].append(entry)
+
+    stored = 0
+    for user_email, user_entries in by_user.items():
+        collection = get_memory_collection(user_email)
+        if collection:
+            stored += _log_user_qa_pairs(collection, user_entries, near_dup_distance)
+            evict_memories(collection)
+    return stored
+
+def _log_user_qa_pairs(collection, entries, near_dup_distance: float):
+    by_id = {}
+    for entry in entries:
+        question, answer = entry["question"], entry["answer"]
+        if question and answer:
+            by_id.setdefault(memory_id(question, answer), entry)
+    if not by_id:
+        return 0
+
+    existing = set(collection.get(ids=list(by_id), include=[])["ids"])
+    new_ids = [entry_id for entry_id in by_id if entry_id not in existing]
+    if not new_ids:
+        return 0
+
+    new_entries = [by_id[entry_id] for entry_id in new_ids]
+    missing = [entry["question"] for entry in new_entries if entry.get("embedding") is None]
+    encoded = iter(get_embedding_cache().encode(missing).tolist()) if missing else iter(())
+    embeddings = [
+        entry["embedding"] if entry.get("embedding") is not None else next(encoded)
+        for entry in new_entries
+    ]
+
+    skip = _near_duplicates(collection, embeddings, near_dup_distance)
+    keep = [i for i in range(len(new_entries)) if i not in skip]
+    if not keep:
+        return 0
+
+    now = time.time()
+    collection.add(
+        ids=[new_ids[i] for i in keep],
+        documents=[new_entries[i]["question"] for i in keep],
+        metadatas=[
+            {
+                "answer": new_entries[i]["answer"],
+                "q_hash": question_hash(new_entries[i]["question"]),
+                "created_at": now,
+                "last_hit": now,
+            }
+            for i in keep
+        ],
+        embeddings=[embeddings[i] for i in keep]
+    )
+    return len(keep)
+
+# ----------------- Capacity and Eviction -----------------
+def touch_memories(user_email: str, ids):
+    """Record that memory entries were just used as context (drives LRU eviction)."""
+    collection = get_memory_collection(user_email)
+    if not collection or not ids:
+        return
+    now = time.time()
+    collection.update(ids=list(ids), metadatas=[{"last_hit": now} for _ in ids])
+
+def evict_memories(collection, capacity: int = MEMORY_MAX_ENTRIES_PER_USER,
+                   policy: str = MEMORY_EVICTION_POLICY) -> int:
+    """
+    Trim a memory partition back to capacity, dropping the least recently hit entries
+    (policy "lru") or the oldest ones (policy "age"). Runs only once 10% over capacity,
+    so the metadata scan is amortized over many writes.
+    """
+    count = collection.count()
+    if not capacity or count <= capacity * 1.1:
+        return 0
+
+    found = collection.get(include=["metadatas"])
+    key = "last_hit" if policy == "lru" else "created_at"
+    ranked = sorted(
+        zip(found["ids"], found["metadatas"]),
+        key=lambda item: (item[1] or {}).get(key, 0.0)
+    )
+    victims = [entry_id for entry_id, _ in ranked[:count - capacity]]
+    collection.delete(ids=victims)
+    print(f"[Memory Logger] Evicted {len(victims)} entries from '{collection.name}' ({policy}).")
+    return len(victims)
+
+# ----------------- Compaction -----------------
+def _merge_near_duplicates(found, max_distance: float):
+    """Greedy clustering: keep the most recently hit entry of each group of near-identical questions."""
+    embeddings = np.asarray(found["embeddings"], dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.where(norms == 0, 1, norms)
+
+    metadatas = [metadata or {} for metadata in found["metadatas"]]
+    order = sorted(range(len(found["ids"])), key=lambda i: metadatas[i].get("last_hit", 0.0), reverse=True)
+    kept = []
+    for i in order:
+        if kept and float(np.max(embeddings[kept] @ embeddings[i])) >= 1.0 - max_distance:
+            continue
+        kept.append(i)
+    return sorted(kept)
+
+def _copy_entries(target, found, indexes):
+    for start in range(0, len(indexes), 500):
+        batch = indexes[start:start + 500]
+        target.add(
+            ids=[found["ids"][i] for i in batch],
+            documents=[found["documents"][i] for i in batch],
+            embeddings=[found["embeddings"][i] for i in batch],
+            metadatas=[found["metadatas"][i] for i in batch]
+        )
+
+def _copy_new_entries(source, target, seen: set) -> int:
+    """Carry over entries written to source after it was snapshotted."""
+    found = source.get(include=["documents", "embeddings", "metadatas"])
+    new = [i for i, entry_id in enumerate(found["ids"]) if entry_id not in seen]
+    _copy_entries(target, found, new)
+    seen.update(found["ids"][i] for i in new)
+    return len(new)
+
+def compact_memory(user_email: str = None, collection_name: str = None,
+                   max_distance: float = MEMORY_COMPACTION_DISTANCE) -> dict:
+    """
+    Merge near-duplicate Q&A entries of one memory partition and rebuild its HNSW index
+    by copying the survivors into a side collection that is swapped in through an alias.
+    """
+    name = collection_name or memory_collection_name(user_email)
+    live = get_collection(name)
+    found = live.get(include=["documents", "embeddings", "metadatas"])
+    before = len(found["ids"])
+    if not before:
+        return {"collection": name, "before": 0, "after": 0}
+
+    kept = _merge_near_duplicates(found, max_distance)
+    rebuilt = get_collection(f"{name}__compact_{uuid.uuid4().hex[:8]}")
+    _copy_entries(rebuilt, found, kept)
+
+    # Memories logged while compacting go in before and just after the swap, so none are lost
+    seen = set(found["ids"])
+    added = _copy_new_entries(live, rebuilt, seen)
+    previous = swap_alias(name, rebuilt.name)
+    added += _copy_new_entries(live, rebuilt, seen)
+    delete_collection(previous, follow_alias=False)
+    print(f"[Memory Logger] Compacted '{name}': {before} -> {len(kept)} entries (+{added} logged meanwhile).")
+    return {"collection": name, "before": before, "after": len(kept) + added}
+
+def compact_all_memory(max_distance: float = MEMORY_COMPACTION_DISTANCE):
+    """Compact every memory partition (shared and per-user)."""
+    # Compacted partitions live in "__" side collections behind their logical name
+    names = {name for name in list_collection_names() if "__" not in name} | set(list_aliases())
+    names = sorted(name for name in names
+                   if name == MEMORY_COLLECTION or name.startswith(f"{MEMORY_COLLECTION}_"))
+    return [compact_memory(collection_name=name, max_distance=max_distance) for name in names]
+
 def query_memory(query: str, n=5):
     """Retrieve top-n relevant memory entries."""
+    collection = get_memory_collection()
     if not collection or not collection.count():
         return []
 
@@ -51,3 +263,14 @@ def query_memory(query: str, n=5):
     except Exception as e:
         print(f"[Memory Logger Error] Failed to query memory: {e}")
         return []
+
+# ----------------- CLI -----------------
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "compact":
+        print("Usage: python memory_logger.py compact [user-email]")
+        sys.exit(1)
+
+    if len(sys.argv) > 2:
+        compact_memory(user_email=sys.argv[2])
+    else:
+        compact_all_memory()
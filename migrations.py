@@ -0,0 +1,94 @@
+# migrations.py
+import threading
+from db import get_connection
+
+# ----------------- Versioned Schema -----------------
+# Append new migrations to the end; applied versions are recorded in schema_migrations
+# and never run twice.
+MIGRATIONS = [
+    (1, "create users and chat_history", """
+        CREATE TABLE IF NOT EXISTS users (
+            email TEXT PRIMARY KEY,
+            is_verified BOOLEAN NOT NULL DEFAULT FALSE,
+            created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id SERIAL PRIMARY KEY,
+            user_email TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+        );
+    """),
+    (2, "convert legacy user_message/bot_response chat_history", """
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'chat_history' AND column_name = 'user_message'
+            ) THEN
+                ALTER TABLE chat_history RENAME COLUMN user_message TO question;
+                ALTER TABLE chat_history RENAME COLUMN bot_response TO answer;
+                ALTER TABLE chat_history ADD COLUMN user_email TEXT NOT NULL DEFAULT 'legacy';
+                ALTER TABLE chat_history ALTER COLUMN user_email DROP DEFAULT;
+            END IF;
+        END $$;
+    """),
+    (3, "index chat_history by user and time", """
+        CREATE INDEX IF NOT EXISTS chat_history_user_ts_idx
+            ON chat_history (user_email, timestamp, id);
+    """),
+]
+
+# Arbitrary key shared by every worker so only one of them migrates at a time
+MIGRATION_LOCK_ID = 421337
+
+_applied = False
+_lock = threading.Lock()
+
+def run_migrations(force: bool = False) -> list:
+    """Apply pending migrations once per process; returns the versions applied now."""
+    global _applied
+    if _applied and not force:
+        return []
+
+    with _lock:
+        if _applied and not force:
+            return []
+        applied_now = []
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+                try:
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS schema_migrations (
+                            version INTEGER PRIMARY KEY,
+                            name TEXT NOT NULL,
+                            applied_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+                        );
+                    """)
+                    conn.commit()
+                    cur.execute("SELECT version FROM schema_migrations")
+                    done = {row[0] for row in cur.fetchall()}
+
+                    for version, name, statement in MIGRATIONS:
+                        if version in done:
+                            continue
+                        cur.execute(statement)
+                        cur.execute(
+                            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                            (version, name)
+                        )
+                        conn.commit()
+                        applied_now.append(version)
+                        print(f"[INFO] Applied migration {version}: {name}")
+                finally:
+                    conn.rollback()
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        _applied = True
+        return applied_now
+
+# ----------------- CLI -----------------
+if __name__ == "__main__":
+    applied = run_migrations()
+    print(f"Schema up to date ({len(applied)} migrations applied).")
@@ -0,0 +1,142 @@
+# registry.py
+import os
+import json
+import threading
+import chromadb
+from chromadb import EmbeddingFunction
+from config import VECTORSTORE_PATH, EMBED_BACKEND
+from embedding_backends import load_embedder
+from embedding_cache import get_embedding_cache
+
+# ----------------- Process-wide Singletons -----------------
+# Everything is created on first use so importing a module is cheap, and each
+# Streamlit worker loads the embedding model and opens the vectorstore exactly once.
+_lock = threading.RLock()
+_embedder = None
+_client = None
+_embedding_function = None
+_collections = {}
+_aliases = {}
+_aliases_mtime = None
+
+# Logical collection name -> physical collection, so a rebuilt collection can be swapped in atomically
+ALIASES_PATH = os.path.join(VECTORSTORE_PATH, "aliases.json")
+
+class SharedEmbeddingFunction(EmbeddingFunction):
+    """Chroma embedding function backed by the process-wide embedding backend and cache."""
+
+    def __call__(self, input):
+        return get_embedding_cache().encode(list(input)).tolist()
+
+def get_embedder():
+    """The process-wide embedding model, using the backend selected by EMBED_BACKEND."""
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            if _embedder is None:
+                _embedder = load_embedder(EMBED_BACKEND)
+    return _embedder
+
+def get_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = chromadb.PersistentClient(path=VECTORSTORE_PATH)
+    return _client
+
+def get_embedding_function():
+    global _embedding_function
+    if _embedding_function is None:
+        with _lock:
+            if _embedding_function is None:
+                _embedding_function = SharedEmbeddingFunction()
+    return _embedding_function
+
+# ----------------- Collection Aliases -----------------
+def _load_aliases():
+    """Re-read the alias file when another process has swapped a collection."""
+    global _aliases, _aliases_mtime
+    mtime = os.path.getmtime(ALIASES_PATH) if os.path.exists(ALIASES_PATH) else None
+    if mtime != _aliases_mtime:
+        with _lock:
+            if mtime is None:
+                _aliases = {}
+            else:
+                with open(ALIASES_PATH, "r", encoding="utf-8") as f:
+                    _aliases = json.load(f)
+            _aliases_mtime = mtime
+    return _aliases
+
+def resolve_collection_name(name: str) -> str:
+    return _load_aliases().get(name, name)
+
+def list_aliases() -> dict:
+    """Logical name -> physical collection for every aliased collection."""
+    return dict(_load_aliases())
+
+def _save_aliases(aliases: dict):
+    global _aliases, _aliases_mtime
+    os.makedirs(VECTORSTORE_PATH, exist_ok=True)
+    tmp_path = f"{ALIASES_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(aliases, f, indent=2)
+    os.replace(tmp_path, ALIASES_PATH)
+    _aliases, _aliases_mtime = aliases, os.path.getmtime(ALIASES_PATH)
+
+def swap_alias(name: str, physical_name: str):
+    """
+    Point the logical name at physical_name in one atomic file replace; readers switch on
+    their next lookup. Returns the physical collection the name pointed at before.
+    """
+    with _lock:
+        aliases = dict(_load_aliases())
+        previous = aliases.get(name, name)
+        aliases[name] = physical_name
+        _save_aliases(aliases)
+    return previous
+
+def _drop_alias(name: str):
+    with _lock:
+        aliases = dict(_load_aliases())
+        if aliases.pop(name, None) is not None:
+            _save_aliases(aliases)
+
+# ----------------- Collections -----------------
+def get_collection(name: str, metadata: dict = None):
+    """Return a cached handle for the named (or aliased) collection, creating it if needed."""
+    name = resolve_collection_name(name)
+    collection = _collections.get(name)
+    if collection is None:
+        with _lock:
+            collection = _collections.get(name)
+            if collection is None:
+                collection = get_client().get_or_create_collection(
+                    name=name,
+                    metadata=metadata,
+                    embedding_function=get_embedding_function()
+                )
+                _collections[name] = collection
+    return collection
+
+def list_collection_names():
+    # Older Chroma releases return Collection objects, newer ones return names
+    return [c if isinstance(c, str) else c.name for c in get_client().list_collections()]
+
+def collection_exists(name: str) -> bool:
+    return resolve_collection_name(name) in list_collection_names()
+
+def delete_collection(name: str, follow_alias: bool = True):
+    """
+    Delete a collection; deleting through an alias deletes its target and drops the alias.
+    follow_alias=False deletes the physical collection of that name, e.g. one just swapped out.
+    """
+    physical_name = resolve_collection_name(name) if follow_alias else name
+    with _lock:
+        _collections.pop(physical_name, None)
+    if physical_name != name:
+        _drop_alias(name)
+    try:
+        get_client().delete_collection(physical_name)
+    except Exception:
+        pass
@@ -0,0 +1,187 @@
+# retrieval.py
+import asyncio
+import heapq
+import re
+from concurrent.futures import ThreadPoolExecutor
+import lexical_index
+from config import RRF_K
+
+# ----------------- Config -----------------
+MAX_WORKERS = 8             # Concurrent collection queries per process
+DEDUP_SHINGLE_SIZE = 5      # Words per shingle when comparing chunks
+DEDUP_THRESHOLD = 0.9       # Jaccard similarity above which a chunk is a near-duplicate
+
+# Shared pool so each question does not pay for spinning up threads
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="retrieval")
+
+# ----------------- Collection Queries -----------------
+def query_collection(collection, query_embedding, top_k: int):
+    """Query one collection and return its hits (sorted by distance) with scores kept."""
+    results = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=top_k,
+        include=["documents", "distances", "metadatas"],
+    )
+    documents = (results.get("documents") or [[]])[0]
+    distances = (results.get("distances") or [[]])[0]
+    metadatas = (results.get("metadatas") or [[]])[0] or [None] * len(documents)
+    ids = (results.get("ids") or [[]])[0]
+
+    hits = []
+    for doc_id, doc, distance, metadata in zip(ids, documents, distances, metadatas):
+        if not doc:
+            continue
+        hits.append({
+            "id": doc_id,
+            "text": doc,
+            "distance": float(distance),
+            "collection": collection.name,
+            "metadata": metadata or {},
+        })
+    hits.sort(key=lambda hit: hit["distance"])
+    return hits
+
+def query_collections(collections, query_embedding, top_k: int):
+    """Query several collections concurrently; failures are logged and skipped."""
+    futures = [
+        (collection.name, _executor.submit(query_collection, collection, query_embedding, top_k))
+        for collection in collections
+    ]
+
+    result_lists = []
+    for name, future in futures:
+        try:
+            result_lists.append(future.result())
+        except Exception as e:
+            print(f"[Retrieval Error] Collection '{name}': {e}")
+    return result_lists
+
+# ----------------- Merging -----------------
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= DEDUP_SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + DEDUP_SHINGLE_SIZE]) for i in range(len(words) - DEDUP_SHINGLE_SIZE + 1)}
+
+def _is_near_duplicate(shingles: set, kept: list, threshold: float) -> bool:
+    for other in kept:
+        union = len(shingles | other)
+        if union and len(shingles & other) / union >= threshold:
+            return True
+    return False
+
+def _dedup_top_k(hits, top_k: int, dedup_threshold: float):
+    merged = []
+    kept_shingles = []
+    for hit in hits:
+        shingles = _shingles(hit["text"])
+        if _is_near_duplicate(shingles, kept_shingles, dedup_threshold):
+            continue
+        merged.append(hit)
+        kept_shingles.append(shingles)
+        if len(merged) >= top_k:
+            break
+    return merged
+
+def merge_top_k(result_lists, top_k: int, dedup_threshold: float = DEDUP_THRESHOLD):
+    """
+    Merge per-collection hit lists into one global top-k by distance.
+    Each list is already sorted, so a heap merge only touches what it returns.
+    Near-duplicate chunks (e.g. the same page uploaded twice) are dropped.
+    """
+    return _dedup_top_k(heapq.merge(*result_lists, key=lambda hit: hit["distance"]), top_k, dedup_threshold)
+
+def retrieve(collections, query_embedding, top_k: int = 5):
+    """Concurrently query every collection and return the merged, deduplicated top-k."""
+    if not collections:
+        return []
+    return merge_top_k(query_collections(collections, query_embedding, top_k), top_k)
+
+# ----------------- Hybrid (BM25 + vectors) -----------------
+def lexical_query_collection(collection, query: str, top_k: int):
+    """BM25 hits for one collection, hydrated with their text from Chroma."""
+    scored = lexical_index.search(collection.name, query, top_k)
+    if not scored:
+        return []
+    found = collection.get(ids=[doc_id for doc_id, _ in scored], include=["documents", "metadatas"])
+    by_id = {
+        doc_id: (doc, metadata)
+        for doc_id, doc, metadata in zip(found["ids"], found["documents"], found["metadatas"] or [None] * len(found["ids"]))
+    }
+    hits = []
+    for doc_id, score in scored:
+        if doc_id not in by_id or not by_id[doc_id][0]:
+            continue
+        doc, metadata = by_id[doc_id]
+        hits.append({
+            "id": doc_id,
+            "text": doc,
+            "bm25": score,
+            "collection": collection.name,
+            "metadata": metadata or {},
+        })
+    return hits
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K):
+    """
+    Fuse ranked hit lists: each hit scores sum(1 / (k + rank)) over the lists it appears in.
+    Hits are identified by (collection, id); fields from every list are kept on the fused hit.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            key = (hit["collection"], hit["id"])
+            entry = fused.setdefault(key, {**hit, "rrf": 0.0})
+            entry.update({field: value for field, value in hit.items() if field not in entry})
+            entry["rrf"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda hit: hit["rrf"], reverse=True)
+
+def lexical_query_collections(collections, query: str, top_k: int):
+    """BM25-search several collections concurrently; failures are logged and skipped."""
+    futures = [
+        (collection.name, _executor.submit(lexical_query_collection, collection, query, top_k))
+        for collection in collections
+    ]
+
+    result_lists = []
+    for name, future in futures:
+        try:
+            result_lists.append(future.result())
+        except Exception as e:
+            print(f"[Retrieval Error] BM25 search on '{name}': {e}")
+    return result_lists
+
+def fuse_top_k(dense_lists, lexical_lists, top_k: int, dedup_threshold: float = DEDUP_THRESHOLD):
+    """
+    Merge dense hits into one global ranking by distance and BM25 hits into one by score,
+    then fuse the two rankings with RRF. Without lexical hits this is plain merge_top_k.
+    """
+    lexical = sorted((hit for hits in lexical_lists for hit in hits), key=lambda hit: hit["bm25"], reverse=True)
+    if not lexical:
+        return merge_top_k(dense_lists, top_k, dedup_threshold)
+    dense = list(heapq.merge(*dense_lists, key=lambda hit: hit["distance"]))
+    return _dedup_top_k(reciprocal_rank_fusion([dense, lexical]), top_k, dedup_threshold)
+
+# ----------------- Async -----------------
+async def _gather_lists(label: str, fn, collections, *args):
+    """Run fn(collection, *args) for every collection on the shared pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(
+        *(loop.run_in_executor(_executor, fn, collection, *args) for collection in collections),
+        return_exceptions=True
+    )
+    result_lists = []
+    for collection, result in zip(collections, results):
+        if isinstance(result, BaseException):
+            print(f"[Retrieval Error] {label}'{collection.name}': {result}")
+        else:
+            result_lists.append(result)
+    return result_lists
+
+async def aquery_collections(collections, query_embedding, top_k: int):
+    """Async query_collections."""
+    return await _gather_lists("Collection ", query_collection, collections, query_embedding, top_k)
+
+async def alexical_query_collections(collections, query: str, top_k: int):
+    """Async lexical_query_collections."""
+    return await _gather_lists("BM25 search on ", lexical_query_collection, collections, query, top_k)
@@ -1,25 +1,21 @@
 import requests
-import json
+from llm_client import get_llm_client, LLMError
 
-LLM_ENDPOINT = "http://localhost:11434/api/generate"
-LLM_MODEL = "deepseek-coder:6.7b"
 TEST_PROMPT = "What is the capital of France?"
 
-headers = {"Content-Type": "application/json"}
-data = {"model": LLM_MODEL, "prompt": TEST_PROMPT, "stream": False}
+client = get_llm_client()
 
 try:
-    response = requests.post(LLM_ENDPOINT, headers=headers, data=json.dumps(data))
-    response.raise_for_status() # Raise an exception for bad status codes
-    
-    response_json = response.json()
-    ai_response = response_json.get("response", "")
-    
+    if not client.is_healthy(force=True):
+        raise LLMError(f"Ollama is not reachable at {client.base_url}")
+
+    ai_response = client.generate(TEST_PROMPT)
+
     print("Ollama LLM connection successful!")
-    print(f"Model: {LLM_MODEL}")
+    print(f"Model: {client.model}")
     print(f"Response: {ai_response}")
-    
-except requests.exceptions.RequestException as e:
+
+except (LLMError, requests.exceptions.RequestException) as e:
     print("Error connecting to Ollama LLM.")
     print(f"Error details: {e}")
     print("Please ensure Ollama is running (e.g., `ollama serve`) and the model `deepseek-coder:6.7b` is pulled.")
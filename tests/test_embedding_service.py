@@ -0,0 +1,72 @@
+# tests/test_embedding_service.py
+import threading
+import time
+import numpy as np
+import pytest
+import embedding_service
+from embedding_service import EmbeddingService
+
+class RecordingEmbedder:
+    """Embeds "12" as [12.0] and records the texts of every forward pass."""
+
+    def __init__(self, gate=None):
+        self.calls = []
+        self.gate = gate
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True):
+        self.calls.append(list(texts))
+        if self.gate is not None and len(self.calls) == 1:
+            self.gate.wait(5)
+        return np.asarray([[float(text)] for text in texts], dtype=np.float32)
+
+@pytest.fixture
+def embedder(monkeypatch):
+    recorder = RecordingEmbedder()
+    monkeypatch.setattr(embedding_service, "get_embedder", lambda: recorder)
+    return recorder
+
+def test_large_request_is_split_into_max_batch_slices(embedder):
+    service = EmbeddingService(wait_ms=0, max_batch=4)
+    vectors = service.encode([str(i) for i in range(10)])
+
+    assert vectors[:, 0].tolist() == list(range(10))
+    assert [len(call) for call in embedder.calls] == [4, 4, 2]
+    assert service.stats()["max_batch_texts"] == 4
+
+def test_interactive_request_goes_before_queued_bulk_slices(monkeypatch):
+    gate = threading.Event()
+    embedder = RecordingEmbedder(gate)
+    monkeypatch.setattr(embedding_service, "get_embedder", lambda: embedder)
+    service = EmbeddingService(wait_ms=0, max_batch=4)
+
+    bulk = {}
+    worker = threading.Thread(target=lambda: bulk.update(vectors=service.encode(
+        [str(i) for i in range(10)], bulk=True)))
+    worker.start()
+    # The first bulk slice is being encoded; the two others wait in the queue
+    while not embedder.calls or service._queue.qsize() < 2:
+        time.sleep(0.001)
+    threading.Timer(0.05, gate.set).start()
+    query = service.encode(["100"])
+    worker.join(5)
+
+    assert query[:, 0].tolist() == [100.0]
+    assert bulk["vectors"][:, 0].tolist() == list(range(10))
+    assert embedder.calls == [["0", "1", "2", "3"], ["100"], ["4", "5", "6", "7"], ["8", "9"]]
+
+def test_failure_reaches_the_caller_and_the_service_keeps_running(monkeypatch):
+    class FailingOnce(RecordingEmbedder):
+        def encode(self, texts, **kwargs):
+            if not self.calls:
+                self.calls.append(list(texts))
+                raise RuntimeError("model crashed")
+            return super().encode(texts, **kwargs)
+
+    embedder = FailingOnce()
+    monkeypatch.setattr(embedding_service, "get_embedder", lambda: embedder)
+    service = EmbeddingService(wait_ms=0, max_batch=4)
+
+    with pytest.raises(RuntimeError):
+        service.encode(["1", "2"])
+    assert service.encode(["3"])[:, 0].tolist() == [3.0]
+    assert service.stats()["errors"] == 1
@@ -0,0 +1,75 @@
+# tests/test_lexical_index.py
+import math
+import pytest
+import lexical_index
+from lexical_index import LexicalIndex, tokenize
+
+DOCS = {
+    "a": "call read_csv to load the file",
+    "b": "ValueError raised when the file is missing",
+    "c": "the file the file the file",
+    "d": "parseConfig reads E1101 from the config",
+}
+
+@pytest.fixture(autouse=True)
+def index_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(lexical_index, "LEXICAL_ROOT", str(tmp_path))
+    lexical_index._indexes.clear()
+
+def build(segments, name="docs"):
+    index = LexicalIndex(name)
+    for ids in segments:
+        index.add_segment(ids, [DOCS[doc_id] for doc_id in ids])
+    return index
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    tokens = tokenize("parseConfig read_csv E1101")
+    assert {"parseconfig", "parse", "config", "read_csv", "read", "csv", "e1101"} <= set(tokens)
+
+def test_exact_identifier_ranks_first():
+    index = build([list(DOCS)])
+    assert index.search("read_csv", top_k=1)[0][0] == "a"
+    assert index.search("E1101")[0][0] == "d"
+    assert index.search("nothing matches") == []
+
+def test_bm25_score_matches_the_formula():
+    index = build([list(DOCS)])
+    k1, b = 1.2, 0.75
+    lengths = {doc_id: len(tokenize(text)) for doc_id, text in DOCS.items()}
+    avg_length = sum(lengths.values()) / len(lengths)
+    df = sum(1 for text in DOCS.values() if "missing" in tokenize(text))
+    idf = math.log(1 + (len(DOCS) - df + 0.5) / (df + 0.5))
+    expected = idf * (k1 + 1) / (1 + k1 * (1 - b + b * lengths["b"] / avg_length))
+
+    (doc_id, score), = index.search("missing", top_k=1, k1=k1, b=b)
+    assert doc_id == "b"
+    assert score == pytest.approx(expected, rel=1e-5)
+
+def test_segments_and_merging_do_not_change_results(monkeypatch):
+    single = build([list(DOCS)], name="single")
+    monkeypatch.setattr(lexical_index, "LEXICAL_MAX_SEGMENTS", 2)
+    segmented = build([["a"], ["b"], ["c", "d"]], name="segmented")
+
+    # The third segment pushed the index over the limit, so everything was merged into one
+    assert len(segmented.segments) == 1
+    for query in ("file", "the config", "read_csv missing"):
+        expected = single.search(query, top_k=4)
+        result = segmented.search(query, top_k=4)
+        assert [doc_id for doc_id, _ in result] == [doc_id for doc_id, _ in expected]
+        assert [score for _, score in result] == pytest.approx([score for _, score in expected])
+
+def test_already_indexed_ids_are_skipped():
+    index = build([["a", "b"]])
+    assert index.add_segment(["a", "c"], [DOCS["a"], DOCS["c"]]) == 1
+    assert index.indexed_ids == {"a", "b", "c"}
+
+def test_writer_flushes_segments_visible_to_other_handles(monkeypatch):
+    monkeypatch.setattr(lexical_index, "LEXICAL_SEGMENT_DOCS", 2)
+    writer = lexical_index.IndexWriter("shared")
+    for doc_id in ("a", "b", "c"):
+        writer.add(doc_id, DOCS[doc_id])
+    assert lexical_index.search("shared", "read_csv")[0][0] == "a"
+    writer.flush()
+
+    assert LexicalIndex("shared").indexed_ids == {"a", "b", "c"}
+    assert lexical_index.search("shared", "missing")[0][0] == "b"
@@ -0,0 +1,88 @@
+# tests/test_llm_scheduler.py
+import asyncio
+import pytest
+from llm_scheduler import LLMScheduler, LLMBusyError
+
+def test_round_robin_positions_and_grant_order():
+    scheduler = LLMScheduler(max_concurrent=1, max_queue=10, max_per_user=5)
+    a1 = scheduler.submit("a")
+    a2, a3 = scheduler.submit("a"), scheduler.submit("a")
+    b1 = scheduler.submit("b")
+
+    assert a1.granted.is_set()
+    # Round-robin: every user's k-th request goes before anyone's (k+1)-th
+    assert [a2.position(), b1.position(), a3.position()] == [1, 2, 3]
+
+    granted = []
+    for ticket in (a1, a2, b1):
+        ticket.release()
+        granted.append(next(t for t in (a2, b1, a3) if t.granted.is_set() and t not in granted))
+    assert granted == [a2, b1, a3]
+    assert a3.position() == 0
+
+def test_rejects_past_queue_limits():
+    scheduler = LLMScheduler(max_concurrent=1, max_queue=2, max_per_user=1)
+    scheduler.submit("a")             # generating
+    scheduler.submit("a")             # waiting
+    assert not scheduler.would_admit("a")
+    with pytest.raises(LLMBusyError):
+        scheduler.submit("a")
+
+    scheduler.submit("b")
+    assert not scheduler.would_admit("c")
+    with pytest.raises(LLMBusyError):
+        scheduler.submit("c")
+    assert scheduler.stats()["rejected"] == 2
+
+def test_release_withdraws_waiting_ticket():
+    scheduler = LLMScheduler(max_concurrent=1, max_queue=10, max_per_user=5)
+    first = scheduler.submit("a")
+    waiting = scheduler.submit("b")
+    waiting.release()
+    stats = scheduler.stats()
+    assert (stats["queued"], stats["cancelled"]) == (0, 1)
+
+    first.release()
+    assert not waiting.granted.is_set()
+    assert scheduler.stats()["active"] == 0
+
+def test_aslot_is_woken_on_the_event_loop_when_granted():
+    scheduler = LLMScheduler(max_concurrent=1, max_queue=10, max_per_user=5)
+    positions = []
+
+    async def main():
+        holder = scheduler.submit("a")
+        loop = asyncio.get_running_loop()
+        # Released from another thread, as a finishing synchronous request would
+        loop.call_later(0.05, lambda: loop.run_in_executor(None, holder.release))
+        async with scheduler.aslot("b", on_queue=positions.append, timeout=5) as ticket:
+            assert ticket.granted.is_set()
+
+    asyncio.run(main())
+    assert positions[0] == 1 and positions[-1] == 0
+    assert scheduler.stats()["active"] == 0
+
+def test_aslot_timeout_and_cancellation_leave_the_queue():
+    scheduler = LLMScheduler(max_concurrent=1, max_queue=10, max_per_user=5)
+
+    async def main():
+        holder = scheduler.submit("a")
+        with pytest.raises(LLMBusyError):
+            async with scheduler.aslot("b", timeout=0.1):
+                pass
+
+        async def wait_in_line():
+            async with scheduler.aslot("c", timeout=5):
+                pass
+
+        task = asyncio.create_task(wait_in_line())
+        await asyncio.sleep(0.05)
+        assert scheduler.stats()["queued"] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        holder.release()
+
+    asyncio.run(main())
+    stats = scheduler.stats()
+    assert (stats["timed_out"], stats["queued"], stats["active"]) == (1, 0, 0)
@@ -0,0 +1,131 @@
+# write_behind.py
+import atexit
+import queue
+import threading
+import time
+from psycopg2.extras import execute_values
+from config import WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_MAX_QUEUE
+from db import get_connection
+from memory_logger import log_qa_pairs, touch_memories
+
+# ----------------- Write-behind Queue -----------------
+# Completed Q/A pairs are queued here and persisted by one background thread per process:
+# chat_history rows in a single execute_values insert, memory entries in a single Chroma add.
+_queue = queue.Queue(maxsize=WRITE_BEHIND_MAX_QUEUE)
+_stop = threading.Event()
+_thread = None
+_thread_lock = threading.Lock()
+_stats = {"chat_rows": 0, "memory_entries": 0, "flushes": 0, "errors": 0}
+
+def _ensure_started():
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        with _thread_lock:
+            if _thread is None or not _thread.is_alive():
+                _stop.clear()
+                _thread = threading.Thread(target=_run, name="write-behind", daemon=True)
+                _thread.start()
+
+def enqueue_chat(user_email: str, question: str, answer: str):
+    """Queue a chat_history row; blocks only if the queue is full (backpressure)."""
+    _ensure_started()
+    _queue.put(("chat", (user_email, question, answer)))
+
+def enqueue_memory(question: str, answer: str, embedding=None, user_email: str = None):
+    """Queue a Q/A pair for the user's memory; a precomputed question embedding saves an encode."""
+    _ensure_started()
+    _queue.put(("memory", {"question": question, "answer": answer, "embedding": embedding,
+                           "user_email": user_email}))
+
+def enqueue_memory_touch(user_email: str, ids):
+    """Queue a last-hit update for memory entries that were used as context."""
+    _ensure_started()
+    _queue.put(("touch", (user_email, list(ids))))
+
+# ----------------- Flushing -----------------
+def _write_chats(rows):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                "INSERT INTO chat_history (user_email, question, answer) VALUES %s",
+                rows
+            )
+
+def _flush(batch):
+    chats = [payload for kind, payload in batch if kind == "chat"]
+    memories = [payload for kind, payload in batch if kind == "memory"]
+    touches = [payload for kind, payload in batch if kind == "touch"]
+    if chats:
+        try:
+            _write_chats(chats)
+            _stats["chat_rows"] += len(chats)
+        except Exception as e:
+            _stats["errors"] += 1
+            print(f"[PostgreSQL Logging Error]: {e}")
+    if memories:
+        try:
+            _stats["memory_entries"] += log_qa_pairs(memories)
+        except Exception as e:
+            _stats["errors"] += 1
+            print(f"[Memory Logger Error] Failed to add to collection: {e}")
+    if touches:
+        ids_by_user = {}
+        for user_email, ids in touches:
+            ids_by_user.setdefault(user_email, set()).update(ids)
+        for user_email, ids in ids_by_user.items():
+            try:
+                touch_memories(user_email, ids)
+            except Exception as e:
+                _stats["errors"] += 1
+                print(f"[Memory Logger Error] Failed to update last hit: {e}")
+    _stats["flushes"] += 1
+
+def _drain(limit: int):
+    batch = []
+    while len(batch) < limit:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+def _run():
+    while not _stop.is_set():
+        batch = []
+        deadline = time.monotonic() + WRITE_BEHIND_FLUSH_INTERVAL
+        # Flush when the batch is full or the interval has elapsed, whichever comes first
+        while len(batch) < WRITE_BEHIND_BATCH_SIZE and not _stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        if batch:
+            _flush(batch)
+            for _ in batch:
+                _queue.task_done()
+
+def flush():
+    """Synchronously persist everything queued so far (used at shutdown and by scripts)."""
+    while True:
+        batch = _drain(WRITE_BEHIND_BATCH_SIZE)
+        if not batch:
+            break
+        _flush(batch)
+        for _ in batch:
+            _queue.task_done()
+
+def shutdown(timeout: float = 10.0):
+    """Stop the background writer and drain whatever is still queued."""
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=timeout)
+    flush()
+
+def stats() -> dict:
+    return dict(_stats, queued=_queue.qsize())
+
+atexit.register(shutdown)